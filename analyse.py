@@ -12,22 +12,25 @@ from helpers import getMidiNoteWithCents
 #   (2) % of predictions within 100 cents of true frequency
 #   (3) % of predictions within 100 cents of true frequency +\- 1 octave
 
+#(each of these also accepts arrays of frequencies, giving an array of errors)
 # (0)
 def getPercentageError(expectedFreq, actualFreq):
-    return (abs(expectedFreq-actualFreq))/expectedFreq
+    return np.abs(np.subtract(expectedFreq, actualFreq))/expectedFreq
 
 #(1)
 def getAbsoluteMIDIError(expectedFreq, actualFreq):
-    return abs(getMidiNoteWithCents(expectedFreq) - getMidiNoteWithCents(actualFreq))
+    return np.abs(getMidiNoteWithCents(expectedFreq) - getMidiNoteWithCents(actualFreq))
 
 #(2)
 def isWithin100Cents(expectedFreq, actualFreq):
-    return int(abs(getMidiNoteWithCents(expectedFreq) - getMidiNoteWithCents(actualFreq)) <= 0.5)
+    isCorrect = getAbsoluteMIDIError(expectedFreq, actualFreq) <= 0.5
+    return int(isCorrect) if np.ndim(isCorrect) == 0 else isCorrect.astype(int)
 
 #(3)
 def isWithin100CentsWithOctaveError(expectedFreq, actualFreq):
-    diff = abs(getMidiNoteWithCents(expectedFreq) - getMidiNoteWithCents(actualFreq))
-    return int(diff <= 0.5 or (diff <= 12.5 and diff >= 11.5))
+    diff = getAbsoluteMIDIError(expectedFreq, actualFreq)
+    isCorrect = (diff <= 0.5) | ((diff <= 12.5) & (diff >= 11.5))
+    return int(isCorrect) if np.ndim(isCorrect) == 0 else isCorrect.astype(int)
 
 def getMeanTimeAndErrors(conditions, csvFilePath, verbose=False, freqRange = [20,20000], partialConditions=None, partialAtStart=True):
     '''Returns a list of the form [mean time, mean percentErr, mean absMidiErr, mean correctNote, mean correctNoteWithOctaveErr] 
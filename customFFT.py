@@ -1,24 +1,220 @@
-import cmath
+import numpy as np
+from functools import lru_cache
 
 def fft(signal, fullLength=False):
-    bins = [re+0j for re in signal]
-    fftRecurse(bins)
+    '''Fourier transform of *signal* (or of each row of *signal* if it is a 2-D array), which may be of any length.
+    Real signals of even length use rfft() (unless *fullLength* is True) and any others are transformed by complexFFT().'''
+    N = np.shape(signal)[-1]
+    if not fullLength and N % 2 == 0 and N > 1 and not np.iscomplexobj(signal):
+        return rfft(signal)
+
+    bins = complexFFT(np.array(signal, dtype=complex))
+
     if fullLength:
         return bins
-    return bins[:1+len(bins)//2] #to conform to np.fft practices
-
-def fftRecurse(data):
-    N = len(data)
-    
-    if N > 1:
-        even = data[0:N:2]
-        odd  = data[1:N:2]
-    
-        fftRecurse(even)
-        fftRecurse(odd)
-
-        for k in range(N//2):
-            t = cmath.exp(-2j*cmath.pi*k/N) * odd[k]
-            data[k] = even[k] + t
-            data[k + N//2] = even[k] - t
-            
\ No newline at end of file
+    return bins[..., :1+N//2] #to conform to np.fft practices
+
+def complexFFT(data):
+    '''Returns the transform of (each row of) the complex array *data*, which may be overwritten. Lengths which are a power of 2 use the iterative in-place FFT,
+    lengths with no prime factors other than 2, 3 and 5 use the mixed-radix FFT and any others use Bluestein's algorithm.'''
+    N = data.shape[-1]
+    if isPowerOf2(N):
+        fftIterative(data)
+        return data
+    elif isFastSize(N):
+        return fftMixedRadix(data)
+    else:
+        return fftBluestein(data)
+
+def ifft(bins, fullLength=False):
+    '''Inverse of fft() - if *fullLength* is True then *bins* should be the full (complex) spectrum, otherwise just the first half of the spectrum of a real signal
+    (as returned by fft() by default) in which case the real signal is returned.'''
+    if not fullLength:
+        return irfft(bins)
+
+    #the inverse transform is the conjugate of the forward transform of the conjugate (scaled by 1/N)
+    signal = fft(np.conj(bins), True)
+    return np.conj(signal) / signal.shape[-1]
+
+def rfft(signal):
+    '''Fourier transform of the real *signal* (or of each row of a 2-D array), whose length N must be even, giving the first N/2+1 bins.
+    The even and odd samples are packed into the real and imaginary parts of one N/2-point complex signal, whose transform is then unpacked into the N/2+1 bins of the real signal
+    - so only half of the work of a full N-point transform is needed.'''
+    signal = np.asarray(signal, dtype=float)
+    N = signal.shape[-1]
+
+    packed = complexFFT(signal[..., 0::2] + 1j*signal[..., 1::2])
+
+    #Z[k] and conj(Z[N/2-k]) (with Z[N/2] = Z[0]) combine to give the transforms of the even (E) and odd (O) samples
+    Z = np.concatenate((packed, packed[..., :1]), axis=-1)
+    Zconj = np.conj(Z[..., ::-1])
+    evenBins = 0.5*(Z + Zconj)
+    oddBins = -0.5j*(Z - Zconj)
+
+    return evenBins + getRealTwiddleFactors(N)*oddBins
+
+def irfft(bins, n=None):
+    '''Inverse of rfft() - returns the real signal of length *n* (by default 2*(len(bins)-1)) whose first n//2+1 bins are *bins*.'''
+    if n is None:
+        n = 2*(np.shape(bins)[-1] - 1)
+    #(the spectrum is truncated or zero-padded to the n/2+1 bins needed)
+    given = np.asarray(bins)
+    numBins = min(n//2+1, given.shape[-1])
+    bins = np.zeros(given.shape[:-1] + (n//2+1,), dtype=complex)
+    bins[..., :numBins] = given[..., :numBins]
+
+    #as with np.fft.irfft, the imaginary parts of the first and last (Nyquist) bins are ignored since they must be 0 for a real signal
+    bins[..., 0] = bins[..., 0].real
+    if n % 2 == 1:
+        #there is no Nyquist bin to pack against, so the rest of the (conjugate-symmetric) spectrum is rebuilt and inverted in full
+        fullBins = np.concatenate((bins, np.conj(bins[..., :0:-1])), axis=-1)
+        return ifft(fullBins, True).real
+    bins[..., -1] = bins[..., -1].real
+
+    #recover the transforms of the even and odd samples, repack them into one n/2-point complex transform and invert it
+    binsConj = np.conj(bins[..., ::-1])
+    evenBins = 0.5*(bins + binsConj)
+    oddBins = 0.5*(bins - binsConj) * np.conj(getRealTwiddleFactors(n))
+    packed = np.conj(evenBins + 1j*oddBins)[..., :n//2]
+
+    packed = np.conj(complexFFT(packed)) / (n//2)
+
+    signal = np.empty(packed.shape[:-1] + (n,))
+    signal[..., 0::2] = packed.real
+    signal[..., 1::2] = packed.imag
+    return signal
+
+def isPowerOf2(N):
+    return N > 0 and N & (N-1) == 0
+
+def isFastSize(N):
+    '''Returns True if *N* has no prime factors other than 2, 3 and 5, so that it can be transformed with the mixed-radix FFT.'''
+    if N < 1:
+        return False
+    for radix in (2, 3, 5):
+        while N % radix == 0:
+            N //= radix
+    return N == 1
+
+def nextFastSize(N):
+    '''Returns the smallest length >= *N* that can be transformed with the mixed-radix FFT (i.e. has no prime factors other than 2, 3 and 5).'''
+    N = max(1, N)
+    while not isFastSize(N):
+        N += 1
+    return N
+
+def previousFastSize(N):
+    '''Returns the largest length <= *N* (and at least 1) that can be transformed with the mixed-radix FFT.'''
+    while N > 1 and not isFastSize(N):
+        N -= 1
+    return max(1, N)
+
+@lru_cache(maxsize=32)
+def getRealTwiddleFactors(N):
+    '''Returns the (memoised, read-only) twiddle factors e^(-2*pi*i*k/N) for k = 0, 1, ..., N/2 used to unpack the transform of a real signal of length N.'''
+    twiddles = np.exp(-2j*np.pi*np.arange(N//2 + 1)/N)
+    twiddles.flags.writeable = False
+    return twiddles
+
+@lru_cache(maxsize=32)
+def getTwiddleFactors(N):
+    '''Returns the (memoised, read-only) twiddle factors e^(-2*pi*i*k/N) for k = 0, 1, ..., N/2 - 1.
+    Every stage of an N-point FFT uses a subset of these, so they only need computing once per N.'''
+    twiddles = np.exp(-2j*np.pi*np.arange(N//2)/N)
+    twiddles.flags.writeable = False
+    return twiddles
+
+@lru_cache(maxsize=32)
+def getBitReversedIndices(N):
+    '''Returns the (memoised, read-only) permutation of 0, 1, ..., N-1 given by reversing the bits of each index (N must be a power of 2).'''
+    numBits = N.bit_length() - 1
+    indices = np.arange(N)
+    reversedIndices = np.zeros(N, dtype=int)
+    for bit in range(numBits):
+        reversedIndices |= ((indices >> bit) & 1) << (numBits - 1 - bit)
+    reversedIndices.flags.writeable = False
+    return reversedIndices
+
+def fftIterative(data):
+    '''Iterative radix-2 (decimation-in-time) FFT computed in place over the last axis of the complex array *data*, whose length must be a power of 2.
+    After putting the samples in bit-reversed order, each stage combines pairs of half-size transforms with one butterfly per pair of bins,
+    where the butterflies of a stage are all computed together.'''
+    N = data.shape[-1]
+    data[...] = data[..., getBitReversedIndices(N)]
+    twiddles = getTwiddleFactors(N)
+
+    size = 2
+    while size <= N:
+        blocks = data.reshape(data.shape[:-1] + (N//size, size))
+        even = blocks[..., :size//2]
+        odd = blocks[..., size//2:]
+
+        t = odd * twiddles[::N//size]
+        odd[...] = even - t
+        even += t
+
+        size *= 2
+
+@lru_cache(maxsize=32)
+def getDFTMatrix(radix):
+    '''Returns the (memoised, read-only) *radix* x *radix* matrix of the DFT, whose [m, j] element is e^(-2*pi*i*m*j/radix).'''
+    indices = np.arange(radix)
+    matrix = np.exp(-2j*np.pi*np.outer(indices, indices)/radix)
+    matrix.flags.writeable = False
+    return matrix
+
+@lru_cache(maxsize=64)
+def getMixedRadixTwiddleFactors(N, radix):
+    '''Returns the (memoised, read-only) *radix* x N/*radix* array of twiddle factors e^(-2*pi*i*j*k/N) used to combine the sub-transforms of one stage of the mixed-radix FFT.'''
+    twiddles = np.exp(-2j*np.pi*np.outer(np.arange(radix), np.arange(N//radix))/N)
+    twiddles.flags.writeable = False
+    return twiddles
+
+def fftMixedRadix(data):
+    '''Mixed-radix (decimation-in-time) FFT over the last axis of the complex array *data*, whose length must have no prime factors other than 2, 3 and 5.
+    The samples are split into *radix* interleaved subsequences which are transformed together (recursively), after which each bin k + m*N/radix is
+    the radix-point DFT (over j) of the twiddled sub-transforms e^(-2*pi*i*j*k/N) * Y_j[k].'''
+    N = data.shape[-1]
+    if N == 1:
+        return data
+    radix = next(r for r in (2, 3, 5) if N % r == 0)
+
+    #row j of subSignals is data[..., j::radix]
+    subSignals = np.swapaxes(data.reshape(data.shape[:-1] + (N//radix, radix)), -1, -2)
+    subTransforms = fftMixedRadix(np.ascontiguousarray(subSignals)) * getMixedRadixTwiddleFactors(N, radix)
+
+    return np.matmul(getDFTMatrix(radix), subTransforms).reshape(data.shape)
+
+@lru_cache(maxsize=32)
+def getBluesteinFactors(N):
+    '''Returns the (memoised, read-only) chirp e^(-pi*i*n^2/N) for n = 0, 1, ..., N-1 along with the padded length and the transform of the conjugate chirp filter used by fftBluestein().'''
+    n = np.arange(N)
+    #n^2 is reduced mod 2N first (which leaves the chirp unchanged) to keep the argument small and so accurate
+    chirp = np.exp(-1j*np.pi*((n*n) % (2*N))/N)
+
+    #the filter is wrapped around so that the circular convolution of the padded signals gives the linear one for the N bins needed
+    paddedLength = 2**(2*N - 2).bit_length()
+    chirpFilter = np.zeros(paddedLength, dtype=complex)
+    chirpFilter[:N] = np.conj(chirp)
+    chirpFilter[paddedLength-N+1:] = np.conj(chirp[:0:-1])
+    fftIterative(chirpFilter)
+
+    chirp.flags.writeable = False
+    chirpFilter.flags.writeable = False
+    return chirp, paddedLength, chirpFilter
+
+def fftBluestein(data):
+    '''Bluestein's (chirp-z) FFT over the last axis of the complex array *data*, which may be of any length N.
+    Writing nk = (n^2 + k^2 - (k-n)^2)/2 turns the DFT into a convolution of the chirped signal with a conjugate chirp, which is computed with power-of-2 FFTs.'''
+    N = data.shape[-1]
+    chirp, paddedLength, chirpFilter = getBluesteinFactors(N)
+
+    padded = np.zeros(data.shape[:-1] + (paddedLength,), dtype=complex)
+    padded[..., :N] = data * chirp
+    fftIterative(padded)
+    padded *= chirpFilter
+
+    #inverse transform of the product (via the conjugate trick) gives the convolution
+    padded = np.conj(padded)
+    fftIterative(padded)
+    return chirp * np.conj(padded[..., :N]) / paddedLength
@@ -1,27 +1,72 @@
 import math
 import numpy as np
 import customFFT
+from functools import lru_cache
+from fractions import Fraction
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 ## MIDI-based helpers
+#every conversion below accepts either a single value or an array of values (e.g. a whole pitch track), which is converted with one numpy expression
+noteNames = ("A","A#","B","C","C#","D","D#","E","F","F#","G","G#")
+
 def getMidiNoteWithCents(freq):
-    return 69 + 12*math.log2(freq/440)
+    if np.ndim(freq) == 0:
+        return 69 + 12*math.log2(freq/440)
+    return 69 + 12*np.log2(np.asarray(freq)/440)
 
 def getNoteName(freq):
-    midiNote = round(getMidiNoteWithCents(freq))
-    midiOctave = (midiNote // 12) - 1 
-    return ("A","A#","B","C","C#","D","D#","E","F","F#","G","G#")[(midiNote+3) % 12] + str(midiOctave)
+    if np.ndim(freq) == 0:
+        midiNote = round(getMidiNoteWithCents(freq))
+        midiOctave = (midiNote // 12) - 1 
+        return noteNames[(midiNote+3) % 12] + str(midiOctave)
+
+    midiNotes = np.round(getMidiNoteWithCents(freq)).astype(int)
+    isInRange = (midiNotes >= 0) & (midiNotes < 128)
+    if np.all(isInRange):
+        return midiNoteNames[midiNotes]
+    #(notes outside of the table have their names built individually)
+    names = midiNoteNames[np.clip(midiNotes, 0, 127)].astype(object)
+    names[~isInRange] = [noteNames[(midiNote+3) % 12] + str((midiNote // 12) - 1) for midiNote in midiNotes[~isInRange].tolist()]
+    return names
 
 def getCents(freq):
     '''Returns the number of cents that *freq* is away from the nearest in-tune note. This means the int returned is between -49 and 50 (inclusive).'''
-    remainder = getMidiNoteWithCents(freq) % 1
-    if remainder <= 0.5:
-        return round(remainder * 100)
-    else:
-        return round(remainder * 100) - 100
+    if np.ndim(freq) == 0:
+        remainder = getMidiNoteWithCents(freq) % 1
+        if remainder <= 0.5:
+            return round(remainder * 100)
+        else:
+            return round(remainder * 100) - 100
+
+    remainders = getMidiNoteWithCents(freq) % 1
+    return (np.round(remainders * 100) - 100*(remainders > 0.5)).astype(int)
 
 def midiToFreq(midiNote):
+    if np.ndim(midiNote) == 0:
+        return 440*(2**((midiNote - 69)/12))
+
+    midiNote = np.asarray(midiNote)
+    #(whole notes within the MIDI range are looked up rather than calculated)
+    if np.issubdtype(midiNote.dtype, np.integer) and np.all((midiNote >= 0) & (midiNote < 128)):
+        return midiNoteFreqs[midiNote]
     return 440*(2**((midiNote - 69)/12))
 
+#frequencies and names of the 128 MIDI notes, from 0 (C-1) to 127 (G9)
+midiNoteFreqs = np.array([midiToFreq(midiNote) for midiNote in range(128)])
+midiNoteFreqs.flags.writeable = False
+midiNoteNames = np.array([noteNames[(midiNote+3) % 12] + str((midiNote // 12) - 1) for midiNote in range(128)])
+midiNoteNames.flags.writeable = False
+
+def getNearestNoteFreqs(freqs, correctNotes=None):
+    '''Returns the frequencies of the notes closest to each of *freqs* (an array) - the nearest in-tune notes (by the A440 equal temperament tuning standard)
+    if *correctNotes* is None, or otherwise the nearest of the midi values in *correctNotes* (taking the earliest of any that are equally close).'''
+    midiValues = getMidiNoteWithCents(freqs)
+    if correctNotes is None:
+        return midiToFreq(np.round(midiValues).astype(int))
+    correctNotes = np.asarray(correctNotes)
+    return midiToFreq(correctNotes[np.argmin(np.abs(midiValues[:, np.newaxis] - correctNotes), axis=1)])
+
 def noteNameToMidi(noteName):
     octave = int(noteName[-1])
     noteNum = ("C","C#","D","D#","E","F","F#","G","G#","A","A#","B").index(noteName[:-1]) #start at C rather than A because octave numbers change at C, not A
@@ -31,8 +76,12 @@ def noteNameToFreq(noteName):
     return midiToFreq(noteNameToMidi(noteName))
 
 def getPitchInfo(freq, round=False):
-    cents = getCents(freq)
-    noteName = getNoteName(freq)
+    if np.ndim(freq) != 0:
+        #(the cents and note names of every frequency are found at once)
+        return [getPitchInfoString(f, cents, noteName, round) for f, cents, noteName in zip(np.asarray(freq).tolist(), getCents(freq).tolist(), getNoteName(freq).tolist())]
+    return getPitchInfoString(freq, getCents(freq), getNoteName(freq), round)
+
+def getPitchInfoString(freq, cents, noteName, round=False):
     if round:
         freq = "{:.3f}".format(freq)
     if cents >= 0:
@@ -70,24 +119,105 @@ def toMono(signal):
     return [sum(channels) for channels in signal]
 
 def trimForFFT(signal, twoFrameOverlap=False):
+    '''Trims *signal* to the largest length that the FFT handles efficiently (i.e. has no prime factors other than 2, 3 and 5) - note that
+    any length can now be transformed, so this just trades a few samples for speed.'''
     if twoFrameOverlap == False:
-        return signal[:2**(math.floor(math.log2(len(signal))))]
+        return signal[:customFFT.previousFastSize(len(signal))]
     else:
         #naiveFTWithPhase requires an overlap of 75% so we need to extend the window by a quarter
-        windowLength = 2**(math.floor(math.log2(len(signal)*0.8)))
+        windowLength = customFFT.previousFastSize(math.floor(len(signal)*0.8))
         return signal[:windowLength + windowLength//4]
 
+def stretchWindow(windowFunction, length):
+    '''Resamples *windowFunction* to *length* points by linear interpolation, keeping both of its end points (unlike stretch(), which keeps only the first).'''
+    if len(windowFunction) == length:
+        return np.asarray(windowFunction)
+    return np.interp(np.linspace(0, len(windowFunction)-1, length), np.arange(len(windowFunction)), windowFunction)
+
+def getDecimationFactor(sampleRate, expectedMax, blockSize, hopSize, headroom=4):
+    '''Returns the largest factor by which a signal can be decimated (keeping only every factor-th sample) whilst its Nyquist frequency stays at least *headroom* times *expectedMax*
+    - so that the harmonics that some pitch detection algorithms rely on are kept. The factor must also divide both *blockSize* and *hopSize* so that the blocks
+    of the decimated signal start at exactly the same points in time as the original blocks.'''
+    maxFactor = math.floor(sampleRate/(2*headroom*expectedMax))
+    blockGcd = math.gcd(blockSize, hopSize)
+    return max([factor for factor in range(1, max(1, maxFactor)+1) if blockGcd % factor == 0])
+
+@lru_cache(maxsize=16)
+def getDecimationFilter(factor, tapsPerFactor=8):
+    '''Returns the (memoised, read-only) taps of the anti-aliasing low-pass FIR filter used by decimate() - a Hamming-windowed sinc whose cutoff is at
+    90% of the decimated signal's Nyquist frequency.'''
+    numTaps = 2*tapsPerFactor*factor + 1
+    cutoff = 0.9/factor #as a proportion of the original Nyquist frequency
+    taps = np.sinc(cutoff*(np.arange(numTaps) - numTaps//2)) * np.hamming(numTaps)
+    taps /= np.sum(taps)
+    taps.flags.writeable = False
+    return taps
+
+def decimate(signal, factor):
+    '''Reduces the sample rate of *signal* by the integer *factor*: the signal is low-pass filtered (so that nothing above the new Nyquist frequency aliases) and then only every factor-th sample is kept.
+    Sample i of the decimated signal lines up with sample i*factor of the original.'''
+    signal = np.asarray(signal, dtype=float)
+    if factor == 1:
+        return signal
+    return np.convolve(signal, getDecimationFilter(factor), mode="same")[::factor]
+
 def linearInterpolate(x1, x2, gamma):
     return (x1 + (x2-x1)*gamma)
 
-def resample(signal, oldSampleRate, newSampleRate):
-    resampledSignal = []
-    step = oldSampleRate/newSampleRate
-    resampleIndex = 0
-    while resampleIndex < len(signal)-1:
-        resampledSignal.append(linearInterpolate(signal[math.floor(resampleIndex)], signal[math.ceil(resampleIndex)], resampleIndex % 1))
-        resampleIndex += step
+def resample(signal, oldSampleRate, newSampleRate, isPolyphase=False, maxDenominator=1000):
+    '''Resamples *signal* from *oldSampleRate* to *newSampleRate*, returning an array. By default each new sample is linearly interpolated between its two neighbouring
+    original samples (so the signal is not low-pass filtered first). If *isPolyphase* is True then the ratio of the sample rates is approximated by a fraction up/down
+    (whose denominator is at most *maxDenominator*) and the signal is resampled with a windowed-sinc polyphase filter bank (see getPolyphaseFilterBank()) instead,
+    which also removes anything that would alias when downsampling.'''
+    if isPolyphase:
+        ratio = Fraction(newSampleRate/oldSampleRate).limit_denominator(maxDenominator)
+        return resamplePolyphase(signal, ratio.numerator, ratio.denominator)
 
+    signal = np.asarray(signal, dtype=float)
+    step = oldSampleRate/newSampleRate
+    if len(signal) < 2:
+        return np.zeros(0)
+
+    #the indices are accumulated one step at a time (as a running sum, rather than i*step) so that they round in exactly the same way as they always have
+    numSamples = math.ceil((len(signal)-1)/step) + 1
+    resampleIndices = np.concatenate(([0.0], np.cumsum(np.full(numSamples, step))))
+    resampleIndices = resampleIndices[resampleIndices < len(signal)-1]
+
+    lowerSamples = signal[np.floor(resampleIndices).astype(int)]
+    upperSamples = signal[np.ceil(resampleIndices).astype(int)]
+    return linearInterpolate(lowerSamples, upperSamples, resampleIndices % 1)
+
+@lru_cache(maxsize=16)
+def getPolyphaseFilterBank(up, down, zeroCrossings=16):
+    '''Returns the (memoised, read-only) filter bank used by resamplePolyphase() for upsampling by *up* and downsampling by *down*, as an up x numTaps array.
+    Output sample n lies at time n*down/up (in original samples), i.e. phase p = (n*down) % up of the way between two original samples, and row p holds the taps
+    of a Hann-windowed sinc (with *zeroCrossings* zero crossings on either side) centred on that fractional position. The cutoff is the lower of the two Nyquist frequencies.'''
+    cutoff = min(1, up/down) #as a proportion of the original Nyquist frequency
+    halfLength = math.ceil(zeroCrossings/cutoff)
+    #the distance from the output sample to the original sample under each tap (the first tap sits halfLength-1 samples before the sample at or before the output sample)
+    distances = np.arange(up)[:, np.newaxis]/up + (halfLength - 1) - np.arange(2*halfLength)
+    bank = cutoff * np.sinc(cutoff*distances) * (0.5 + 0.5*np.cos(np.pi*np.clip(distances/halfLength, -1, 1)))
+    bank.flags.writeable = False
+    return bank
+
+def resamplePolyphase(signal, up, down, chunkSize=65536):
+    '''Resamples *signal* by the rational factor *up*/*down* (which should be in lowest terms) with the polyphase filter bank from getPolyphaseFilterBank(), returning ceil(len*up/down) samples.
+    Every output sample is the dot product of one row of the bank with the original samples around it, which are gathered *chunkSize* outputs at a time to limit memory use.'''
+    signal = np.asarray(signal, dtype=float)
+    bank = getPolyphaseFilterBank(up, down)
+    numTaps = bank.shape[1]
+    halfLength = numTaps//2
+
+    #the signal is zero-padded by numTaps on either side so that the taps of every output sample lie within it
+    padded = np.concatenate((np.zeros(numTaps), signal, np.zeros(numTaps)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, numTaps)
+
+    numSamples = -(-len(signal)*up//down)
+    resampledSignal = np.empty(numSamples)
+    for chunkStart in range(0, numSamples, chunkSize):
+        positions = np.arange(chunkStart, min(chunkStart+chunkSize, numSamples)) * down
+        firstTaps = positions//up - (halfLength - 1) + numTaps
+        resampledSignal[chunkStart:chunkStart+chunkSize] = np.einsum("ij,ij->i", windows[firstTaps], bank[positions % up])
     return resampledSignal
 
 def stretch(signal, desiredLength):
@@ -103,73 +233,315 @@ def stretch(signal, desiredLength):
 
 def clipSignal(signal, minMagnitude=-1, maxMagnitude=1):
     '''Clip a signal at values of *minMagnitude* and *maxMagnitude* - note that whilst these take default values -1 and 1 respectively, in order to conform with the values 
-    given by the soundfile module as well as signalGenerator.py, they can be changed since different modules may have different standards e.g. sample values given as integers between 2147483648 and 2147483647.'''
-    for i in range(len(signal)):
-        signal[i] = max(signal[i], minMagnitude)
-        signal[i] = min(signal[i], maxMagnitude)
-
+    given by the soundfile module as well as signalGenerator.py, they can be changed since different modules may have different standards e.g. sample values given as integers between 2147483648 and 2147483647.
+    Like all of the gain helpers below, this works in place on *signal* (an ndarray or a list) and returns it.'''
+    if isinstance(signal, np.ndarray):
+        return np.clip(signal, minMagnitude, maxMagnitude, out=signal, casting="unsafe")
+    signal[:] = np.clip(signal, minMagnitude, maxMagnitude).tolist()
     return signal
 
 def multiplyGain(signal, scalar, clip=True, clipMin=-1, clipMax=1):
-    for i in range(len(signal)):
-        signal[i] *= scalar
+    if isinstance(signal, np.ndarray):
+        np.multiply(signal, scalar, out=signal, casting="unsafe")
+    else:
+        signal[:] = (np.asarray(signal) * scalar).tolist()
     
     if clip:
         return clipSignal(signal,clipMin, clipMax)
 
     return signal
+
+def getPeaks(signal):
+    '''Returns the smallest and largest values of *signal* (as floats).'''
+    signal = np.asarray(signal)
+    return float(np.min(signal)), float(np.max(signal))
     
 def multiplyGainUntilClipping(signal, clipMin=-1, clipMax=1):
-    scalarToMinClip = clipMin/min(signal)
-    scalarToMaxClip = clipMax/max(signal)
+    signalMin, signalMax = getPeaks(signal)
+    scalarToMinClip = clipMin/signalMin
+    scalarToMaxClip = clipMax/signalMax
     return multiplyGain(signal, min(abs(scalarToMinClip), abs(scalarToMaxClip)), True, clipMin, clipMax)
 
 def proportionClipping(signal, clipMin=-1, clipMax=1):
-    clipCount = 0
-    for i in signal:
-        if i <= clipMin or i >= clipMax:
-            clipCount += 1
-    return clipCount / len(signal)
+    signal = np.asarray(signal)
+    return np.count_nonzero((signal <= clipMin) | (signal >= clipMax)) / len(signal)
+
+def addGaussianWhiteNoise(signal, sd=0.05, clip=True, clipMin=-1, clipMax=1, rng=None):
+    '''Adds Gaussian white noise with standard deviation *sd* to *signal* (in place). The noise is drawn all at once from *rng* - an np.random.Generator or a seed for a new one -
+    or from numpy's global random state (as seeded by np.random.seed) if *rng* is None.'''
+    if rng is None:
+        noise = np.random.normal(0, sd, len(signal))
+    else:
+        noise = np.random.default_rng(rng).normal(0, sd, len(signal))
 
-def addGaussianWhiteNoise(signal, sd=0.05, clip=True, clipMin=-1, clipMax=1):
-    for i in range(len(signal)):
-        signal[i] += np.random.normal(0, sd)
+    if isinstance(signal, np.ndarray):
+        np.add(signal, noise, out=signal, casting="unsafe")
+    else:
+        signal[:] = (np.asarray(signal) + noise).tolist()
 
     if clip:
         return clipSignal(signal,clipMin, clipMax)
 
     return signal
 
+@lru_cache(maxsize=64)
+def getWindow(windowType, length, *params, dtype=np.float64):
+    '''Returns the (memoised, read-only) symmetric window function *windowType* of the given *length* as an array of *dtype* (e.g. np.float32), where *windowType* is one of
+    "rectangular", "hann", "hamming", "blackman", "blackmanharris" or "kaiser" - the last of which takes its shape parameter beta as *params*, e.g. getWindow("kaiser", 2048, 8.6).
+    Only the 64 most recently used windows are kept.'''
+    if windowType == "rectangular":
+        window = np.ones(length)
+    elif windowType == "hann":
+        window = np.hanning(length)
+    elif windowType == "hamming":
+        window = np.hamming(length)
+    elif windowType == "blackman":
+        window = np.blackman(length)
+    elif windowType == "blackmanharris":
+        #4-term Blackman-Harris window (with sidelobes 92dB down)
+        phases = 2*np.pi*np.arange(length)/max(1, length-1)
+        window = 0.35875 - 0.48829*np.cos(phases) + 0.14128*np.cos(2*phases) - 0.01168*np.cos(3*phases)
+    elif windowType == "kaiser":
+        window = np.kaiser(length, *params)
+    else:
+        raise ValueError("Unknown window type '%s' - expected one of rectangular, hann, hamming, blackman, blackmanharris or kaiser" % (windowType))
+
+    window = window.astype(dtype)
+    window.flags.writeable = False
+    return window
+
 def getHanningWindow(length):
-    return [(math.sin(math.pi*i/(length-1)))**2 for i in range(length)]
+    return getWindow("hann", length)
+
+@lru_cache(maxsize=128)
+def getFreqVector(length, sampleRate):
+    '''Returns the (memoised, read-only) frequencies of the bins given by fft() for a signal with *length* samples.'''
+    freqVector = np.fft.rfftfreq(length, d=1/sampleRate)
+    freqVector.flags.writeable = False
+    return freqVector
+
+## FFT backends
+# fft() and ifft() (and so every frequency-domain pitch detection algorithm) use whichever backend is currently selected - numpy by default - unless isCustomFFT=True
+# in which case customFFT.py is always used. scipy.fft and pyFFTW are also registered if they are installed. The backend and the number of worker threads used for
+# batches of frames can be chosen globally with setFFTBackend() or temporarily with useFFTBackend() (as a PitchProfile does with its fftBackend and fftWorkers).
+
+class FFTBackend:
+    '''A named set of transforms over the last axis of an array: *rfft* (of a real signal, giving the first N//2+1 bins), *irfft* (its inverse) and *fft*/*ifft* (the full complex transforms).
+    Each is called as transform(x, workers) - backends without their own threading (*isThreaded*=False) are instead given one block of rows per worker thread by runTransform().'''
+    def __init__(self, name, rfft, irfft, fft, ifft, isThreaded=False):
+        self.name = name
+        self.rfft = rfft
+        self.irfft = irfft
+        self.fft = fft
+        self.ifft = ifft
+        self.isThreaded = isThreaded
+
+fftBackends = {}
+fftSettings = {"backend" : "numpy", "workers" : 1}
+
+def registerFFTBackend(backend):
+    fftBackends[backend.name] = backend
+
+registerFFTBackend(FFTBackend("numpy", lambda x, workers: np.fft.rfft(x), lambda x, workers: np.fft.irfft(x), lambda x, workers: np.fft.fft(x), lambda x, workers: np.fft.ifft(x)))
+#customFFT caches its twiddle factors, bit-reversal permutations and chirp filters per size, which are its equivalent of plans
+registerFFTBackend(FFTBackend("custom", lambda x, workers: customFFT.fft(x), lambda x, workers: customFFT.ifft(x), lambda x, workers: customFFT.fft(x, True), lambda x, workers: customFFT.ifft(x, True)))
+
+try:
+    import scipy.fft
+except ImportError:
+    pass
+else:
+    registerFFTBackend(FFTBackend("scipy", lambda x, workers: scipy.fft.rfft(x, workers=workers), lambda x, workers: scipy.fft.irfft(x, workers=workers),
+                                  lambda x, workers: scipy.fft.fft(x, workers=workers), lambda x, workers: scipy.fft.ifft(x, workers=workers), True))
+
+try:
+    import pyfftw.builders
+except ImportError:
+    pass
+else:
+    @lru_cache(maxsize=64)
+    def getFFTWPlan(kind, shape, dtype, workers):
+        '''Returns the (memoised) pyFFTW plan for the transform *kind* ("rfft", "irfft", "fft" or "ifft") of arrays of the given shape and dtype.'''
+        return getattr(pyfftw.builders, kind)(pyfftw.empty_aligned(shape, dtype=dtype), threads=workers)
+
+    def getFFTWTransform(kind, dtype):
+        def transform(x, workers):
+            x = np.asarray(x, dtype=dtype)
+            return getFFTWPlan(kind, x.shape, dtype, workers)(x).copy() #(the plan's output array is reused by its next call)
+        return transform
+
+    registerFFTBackend(FFTBackend("pyfftw", getFFTWTransform("rfft", float), getFFTWTransform("irfft", complex), getFFTWTransform("fft", complex), getFFTWTransform("ifft", complex), True))
+
+def setFFTBackend(name=None, workers=None):
+    '''Selects the backend (by name - see fftBackends) and/or the number of worker threads used by fft() and ifft() from now on. Arguments left as None are unchanged.'''
+    if name is not None:
+        if name not in fftBackends:
+            raise ValueError("unknown FFT backend '%s' (available backends: %s)" % (name, ", ".join(fftBackends)))
+        fftSettings["backend"] = name
+    if workers is not None:
+        fftSettings["workers"] = max(1, workers)
+
+@contextmanager
+def useFFTBackend(name=None, workers=None):
+    '''Context manager which selects the FFT backend and/or number of worker threads (as in setFFTBackend) for the duration of a with block only.'''
+    previousSettings = dict(fftSettings)
+    setFFTBackend(name, workers)
+    try:
+        yield
+    finally:
+        fftSettings.update(previousSettings)
+
+@lru_cache(maxsize=8)
+def getThreadPool(workers):
+    return ThreadPoolExecutor(max_workers=workers)
+
+def runTransform(backend, transform, signal):
+    '''Applies *transform* (one of *backend*'s transforms) to *signal* using the currently selected number of workers. Threaded backends are simply told how many workers to use,
+    whereas for the others a 2-D *signal* is split into one block of rows per worker, each transformed on its own thread.'''
+    workers = fftSettings["workers"]
+    if backend.isThreaded or workers == 1 or np.ndim(signal) != 2 or len(signal) < 2:
+        return transform(signal, workers)
+
+    blocks = np.array_split(np.asarray(signal), min(workers, len(signal)))
+    return np.concatenate(list(getThreadPool(workers).map(lambda block: transform(block, 1), blocks)))
 
 def fft(signal, isCustomFFT, fullLength=False):
-    if isCustomFFT:
-        return customFFT.fft(signal, fullLength)
-    else:
-        return np.fft.rfft(signal)
+    '''Fourier transform of *signal* (using customFFT.py if *isCustomFFT* is True, otherwise the selected backend) - if *signal* is a 2-D array then each of its rows is transformed
+    (giving a 2-D array of bins). Unless *fullLength* is True only the first half of the spectrum (as for a real signal) is returned.'''
+    backend = fftBackends["custom" if isCustomFFT else fftSettings["backend"]]
+    return runTransform(backend, backend.fft if fullLength else backend.rfft, signal)
 
 def ifft(signal, isCustomFFT, fullLength=False):
-    if isCustomFFT:
-        return customFFT.ifft(signal, fullLength)
-    else:
-        return np.fft.ifft(signal)
+    '''Inverse of fft() - if *fullLength* is True then *signal* should be a full (complex) spectrum, otherwise the first half of the spectrum of a real signal
+    (as given by fft()), in which case the real signal is returned.'''
+    backend = fftBackends["custom" if isCustomFFT else fftSettings["backend"]]
+    return runTransform(backend, backend.ifft if fullLength else backend.irfft, signal)
 
 def STFT(signal, windowSize, overlap, isCustomFFT = False, windowFunction=None):
-    if windowFunction == None:
-        windowFunction = [1 for i in range(windowSize)]
+    '''Short-time Fourier transform of *signal*, returned as a 2-D array (frames x windowSize//2+1 bins) of the transforms of each windowed frame of *windowSize* samples,
+    where consecutive frames overlap by *overlap* samples (and any samples after the last full frame are ignored).
+    The frames are a (zero-copy) sliding window view of the signal, which is windowed by broadcasting and transformed with one batched FFT.'''
+    signal = np.asarray(signal, dtype=float)
+    if windowFunction is None:
+        windowFunction = getWindow("rectangular", windowSize)
     elif len(windowFunction) != windowSize:
-        windowFunction = stretch(windowFunction, windowSize)
+        windowFunction = stretchWindow(windowFunction, windowSize)
+
+    if len(signal) < windowSize:
+        return np.zeros((0, windowSize//2+1), dtype=complex)
+    frames = np.lib.stride_tricks.sliding_window_view(signal, windowSize)[::windowSize-overlap]
+    return fft(frames * windowFunction, isCustomFFT)
+
+def overlapAdd(frames, hopSize):
+    '''Returns the signal made by adding together the rows of the 2-D array *frames*, where each row starts *hopSize* samples after the previous one.
+    Each row is split into segments of hopSize samples, and the k-th segments of every row (which land on consecutive hops of the signal) are added in all at once.'''
+    numFrames, windowSize = frames.shape
+    numSegments = -(-windowSize//hopSize)
+    padded = np.zeros((numFrames, numSegments*hopSize), dtype=frames.dtype)
+    padded[:, :windowSize] = frames
+
+    hops = np.zeros((numFrames+numSegments-1, hopSize), dtype=frames.dtype)
+    for k in range(numSegments):
+        hops[k:k+numFrames] += padded[:, k*hopSize:(k+1)*hopSize]
+    return hops.reshape(-1)[:(numFrames-1)*hopSize + windowSize]
+
+def ISTFT(transforms, windowSize, overlap, isCustomFFT = False, windowFunction=None):
+    '''Inverse of STFT() - returns the signal whose short-time Fourier transform (with the same *windowSize*, *overlap* and *windowFunction*) is *transforms*.
+    This uses weighted overlap-add: each inverse transformed frame is windowed again and overlap-added, then divided by the overlap-added squared window.
+    That undoes the windowing wherever the overlap-added squared window is non-zero, but samples where it is zero (e.g. the ends of every frame of a Hann window
+    with no overlap) cannot be recovered and are returned as 0.'''
+    if windowFunction is None:
+        windowFunction = getWindow("rectangular", windowSize)
+    elif len(windowFunction) != windowSize:
+        windowFunction = stretchWindow(windowFunction, windowSize)
+    windowFunction = np.asarray(windowFunction, dtype=float)
+
+    transforms = np.asarray(transforms)
+    if len(transforms) == 0:
+        return np.zeros(0)
+    hopSize = windowSize - overlap
+    if windowSize % 2 == 0:
+        frames = ifft(transforms, isCustomFFT)
+    else:
+        #(the inverse of a real transform assumes an even length, so for odd lengths the full conjugate-symmetric spectrum is inverted instead)
+        frames = ifft(np.concatenate((transforms, np.conj(transforms[:, :0:-1])), axis=1), isCustomFFT, True).real
+    frames = frames * windowFunction
+    signal = overlapAdd(frames, hopSize)
+
+    windowSums = getWindowSums(windowFunction.tobytes(), hopSize, len(frames))
+    np.divide(signal, windowSums, out=signal, where=windowSums > 1e-10)
+    return signal
 
-    N = len(signal)
-    transforms = []
-    startIndex = 0
-    while startIndex + windowSize <= N:
-        transforms.append(fft([signal[startIndex+i]*windowFunction[i] for i in range(windowSize)], isCustomFFT))
-        startIndex += windowSize - overlap
+def getWindowSums(windowBytes, hopSize, numFrames):
+    '''Returns the overlap-added squares of the window (given as the bytes of a float array, so that it can be memoised) over *numFrames* frames *hopSize* samples apart.
+    Only the first and last few hops are affected by the ends of the signal - every hop in between has the same (periodic) sums - so these are all taken from
+    the memoised sums of the shortest run of frames that has a fully overlapped hop (see getWindowSumHops()).'''
+    hops = getWindowSumHops(windowBytes, hopSize)
+    numSegments = (len(hops) + 2)//3
+    windowSize = len(windowBytes)//8
+    if numFrames < 2*numSegments - 1:
+        window = np.frombuffer(windowBytes)
+        return overlapAdd(np.broadcast_to(window**2, (numFrames, windowSize)), hopSize)
+
+    #hops 0 to numSegments-2 ramp up, hops numSegments-1 to numFrames-1 are fully overlapped and the last numSegments-1 hops ramp down
+    middle = np.broadcast_to(hops[numSegments-1], (numFrames - numSegments + 1, hopSize))
+    return np.concatenate((hops[:numSegments-1], middle, hops[2*numSegments-1:])).reshape(-1)[:(numFrames-1)*hopSize + windowSize]
+
+@lru_cache(maxsize=16)
+def getWindowSumHops(windowBytes, hopSize):
+    '''Returns the (memoised, read-only) overlap-added squares of the window (given as the bytes of a float array) over 2*numSegments-1 frames *hopSize* samples apart
+    - where numSegments is the number of hops each frame spans - split into rows of one hop each (the last zero-padded).'''
+    window = np.frombuffer(windowBytes)
+    numSegments = -(-len(window)//hopSize)
+    numFrames = 2*numSegments - 1
+    sums = overlapAdd(np.broadcast_to(window**2, (numFrames, len(window))), hopSize)
+
+    hops = np.zeros((numFrames + numSegments - 1)*hopSize)
+    hops[:len(sums)] = sums
+    hops = hops.reshape(-1, hopSize)
+    hops.flags.writeable = False
+    return hops
+
+class SpectrumContext:
+    '''Lazily computes (and remembers) the Fourier transform of a signal - or of each row of a 2-D array of frames (frames x samples) - along with the 
+    magnitudes, phases, log-magnitudes and frequency vector derived from it, so that several frequency-domain pitch detection algorithms can share one transform.
+    Every getter may be given a *start* and *stop* index to instead use just that part of each frame (as naiveFTWithPhase does with its two overlapping windows).
+    The arrays returned are read-only since they are shared between all users of the context.'''
+    def __init__(self, signal, sampleRate, isCustomFFT=False):
+        self.frames = np.atleast_2d(np.asarray(signal))
+        self.sampleRate = sampleRate
+        self.isCustomFFT = isCustomFFT
+
+        self.cache = {}
+
+    def getCached(self, key, compute):
+        if key not in self.cache:
+            value = compute()
+            value.flags.writeable = False
+            self.cache[key] = value
+        return self.cache[key]
+
+    def getBins(self, start=0, stop=None):
+        return self.getCached(("bins", start, stop), lambda: fft(self.frames[:, start:stop], self.isCustomFFT))
+
+    def getMags(self, start=0, stop=None):
+        return self.getCached(("mags", start, stop), lambda: np.abs(self.getBins(start, stop)))
+
+    def getPhases(self, start=0, stop=None):
+        return self.getCached(("phases", start, stop), lambda: np.angle(self.getBins(start, stop)))
+
+    def getLogMags(self, start=0, stop=None):
+        '''Returns the natural log of the magnitudes, where (to avoid taking the log of zero) any zero magnitude is given the smallest non-zero magnitude of its frame.'''
+        def computeLogMags():
+            mags = self.getMags(start, stop)
+            nonZeroMinMags = np.min(np.where(mags > 0, mags, np.inf), axis=1, keepdims=True)
+            nonZeroMinMags[np.isinf(nonZeroMinMags)] = 1 #frames of pure silence
+            return np.log(np.maximum(mags, nonZeroMinMags))
+        return self.getCached(("logMags", start, stop), computeLogMags)
+
+    def getFreqVector(self, start=0, stop=None):
+        return getFreqVector(self.frames[:, start:stop].shape[1], self.sampleRate)
 
-    return transforms
-    
 
 ## stats helpers
 def getTrimmedMean(data, trimSize):
@@ -206,6 +578,12 @@ def getMedian(data):
 
 # (0)
 def getPercentageError(expectedFreq, actualFreq):
+    if np.ndim(expectedFreq) != 0 or np.ndim(actualFreq) != 0:
+        expectedFreqs, actualFreqs, isBothZero, isNonZero = getErrorMasks(expectedFreq, actualFreq)
+        errors = np.full(expectedFreqs.shape, float("inf"))
+        errors[isBothZero] = 0
+        errors[isNonZero] = np.abs(expectedFreqs[isNonZero]-actualFreqs[isNonZero])/expectedFreqs[isNonZero]
+        return errors
     if expectedFreq == 0 and actualFreq == 0:
         return 0
     if expectedFreq == 0 or actualFreq == 0:
@@ -214,6 +592,11 @@ def getPercentageError(expectedFreq, actualFreq):
 
 #(1)
 def getAbsoluteMIDIError(expectedFreq, actualFreq):
+    if np.ndim(expectedFreq) != 0 or np.ndim(actualFreq) != 0:
+        midiErrors, isBothZero = getMidiErrors(expectedFreq, actualFreq)
+        midiErrors[isBothZero] = 0
+        midiErrors[np.isnan(midiErrors)] = 128
+        return midiErrors
     if expectedFreq == 0 and actualFreq == 0:
         return 0
     if expectedFreq == 0 or actualFreq == 0:
@@ -223,6 +606,9 @@ def getAbsoluteMIDIError(expectedFreq, actualFreq):
 
 #(2)
 def isWithin100Cents(expectedFreq, actualFreq):
+    if np.ndim(expectedFreq) != 0 or np.ndim(actualFreq) != 0:
+        midiErrors, isBothZero = getMidiErrors(expectedFreq, actualFreq)
+        return ((midiErrors <= 0.5) | isBothZero).astype(int)
     if expectedFreq == 0 and actualFreq == 0:
         return 1
     elif expectedFreq == 0 or actualFreq == 0:
@@ -232,6 +618,9 @@ def isWithin100Cents(expectedFreq, actualFreq):
 
 #(3)
 def isWithin100CentsWithOctaveError(expectedFreq, actualFreq):
+    if np.ndim(expectedFreq) != 0 or np.ndim(actualFreq) != 0:
+        midiErrors, isBothZero = getMidiErrors(expectedFreq, actualFreq)
+        return ((midiErrors <= 0.5) | ((midiErrors <= 12.5) & (midiErrors >= 11.5)) | isBothZero).astype(int)
     if expectedFreq == 0 and actualFreq == 0:
         return 1
     elif expectedFreq == 0 or actualFreq == 0:
@@ -239,3 +628,18 @@ def isWithin100CentsWithOctaveError(expectedFreq, actualFreq):
     else:
         diff = abs(getMidiNoteWithCents(expectedFreq) - getMidiNoteWithCents(actualFreq))
         return int(diff <= 0.5 or (diff <= 12.5 and diff >= 11.5))
+
+#the measures above also accept arrays of frequencies (e.g. two whole pitch tracks), for which they return an array of errors calculated with these
+def getErrorMasks(expectedFreqs, actualFreqs):
+    '''Returns *expectedFreqs* and *actualFreqs* as (broadcast) arrays along with masks of where both of them are 0 and where neither of them are.'''
+    expectedFreqs, actualFreqs = np.broadcast_arrays(np.asarray(expectedFreqs, dtype=float), np.asarray(actualFreqs, dtype=float))
+    isBothZero = (expectedFreqs == 0) & (actualFreqs == 0)
+    isNonZero = (expectedFreqs != 0) & (actualFreqs != 0)
+    return expectedFreqs, actualFreqs, isBothZero, isNonZero
+
+def getMidiErrors(expectedFreqs, actualFreqs):
+    '''Returns the absolute differences between the midi values of the arrays *expectedFreqs* and *actualFreqs* (NaN wherever either frequency is 0) along with a mask of where both are 0.'''
+    expectedFreqs, actualFreqs, isBothZero, isNonZero = getErrorMasks(expectedFreqs, actualFreqs)
+    midiErrors = np.full(expectedFreqs.shape, np.nan)
+    midiErrors[isNonZero] = np.abs(getMidiNoteWithCents(expectedFreqs[isNonZero]) - getMidiNoteWithCents(actualFreqs[isNonZero]))
+    return midiErrors, isBothZero
@@ -129,7 +129,7 @@ def HPS():
     signal = [a+b for [a, b] in signal[10000:12048]]
 
     resampledSignals = [resample(signal, sampleRate, sampleRate/i) for i in range(1,5)]
-    fftsMags = [customFFT.fft(sig) for sig in resampledSignals]
+    fftsMags = [list(customFFT.fft(sig)) for sig in resampledSignals]
     print(len(resampledSignals), len(fftsMags[0]))
 
     for n in range(0,4):
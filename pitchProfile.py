@@ -1,7 +1,9 @@
-from predict import zerocross, autocorrelation, AMDF, naiveFT, naiveFTWithPhase, cepstrum, HPS
-from helpers import midiToFreq, getMidiNoteWithCents, getPitchInfo, getTrimmedMean, toMono
+from predict import SlidingLagDetector, isSlidingCheaper, zerocross, autocorrelation, AMDF, yin, naiveFT, naiveFTWithPhase, cepstrum, HPS, SHS, goertzel, zerocrossBatch, yinBatch, naiveFTBatch, naiveFTWithPhaseBatch, cepstrumBatch, HPSBatch, SHSBatch, goertzelBatch
+from helpers import midiToFreq, getNearestNoteFreqs, getPitchInfo, getTrimmedMean, getWindow, useFFTBackend, stretchWindow, getDecimationFactor, decimate
+from customFFT import nextFastSize
 from timeit import default_timer as timer
 import soundfile as sf
+import numpy as np
 
 #dictionary containing typical ranges offundamental frequencies for a variety of instruments
 #note that these ranges are all padded on either side by 250 cents to allow for the inescapable error that all of the pitch detection algorithms have built-in
@@ -18,7 +20,7 @@ import soundfile as sf
 instrumentRanges = {"piano" : [23.8,4836.32], "guitar" : [71.33,1523.34], "cello" : [56.51,1016.71], "violin" : [169.64,4066.84], "voice" : [75.57,1209.08], "bass guitar" : [35.66,761.67], "trumpet":[160.12,1357.15], "flute":[226.45,2418.16]}
 
 class PitchProfile:
-    def __init__(self, location, sampleRate, detectionMode, detectionParams, instrument=None, blockSize=2048, overlap=1024, windowFunction=None, customName=None):
+    def __init__(self, location, sampleRate, detectionMode, detectionParams, instrument=None, blockSize=2048, overlap=1024, windowFunction=None, customName=None, isFastBlockSize=False, fftBackend=None, fftWorkers=None, isDecimated=False, rmsThreshold=None, periodicityThreshold=None):
         self.location = location #location of the file corresponding to this pitchProfile object
 
         self.sampleRate = sampleRate #sampleRate of the signal
@@ -30,17 +32,28 @@ class PitchProfile:
         self.setExpectedFrequencyRange(instrument=self.instrument)
 
         self.blockSize = blockSize #size of chunks by which the signal is split up into and pitch is found individually for
+        if isFastBlockSize:
+            self.blockSize = nextFastSize(blockSize) #round up to the nearest size the FFT handles efficiently (powers of 2 are left unchanged)
         self.overlap = overlap #amount by which chunks overlap
         self.windowFunction = windowFunction
-        if self.windowFunction == None:
-            self.windowFunction = [1 for i in range(self.blockSize)] # defaults to a rectangular window
+        if self.windowFunction is None:
+            self.windowFunction = getWindow("rectangular", self.blockSize) # defaults to a rectangular window
+        elif len(self.windowFunction) != self.blockSize:
+            self.windowFunction = stretchWindow(self.windowFunction, self.blockSize) #(e.g. if the block size was rounded)
 
         if customName == None:
             self.name = location.split("/")[-1]
         else:
             self.name = customName
 
-        self.pitchData = []
+        self.fftBackend = fftBackend #name of the FFT backend to use for this analysis (see helpers.fftBackends) - None uses the globally selected one
+        self.fftWorkers = fftWorkers #number of threads to use for batches of FFTs - None uses the globally selected number
+        self.isDecimated = isDecimated #whether to decimate the signal (as far as the expected frequency range allows) before analysing its pitch
+        self.rmsThreshold = rmsThreshold #blocks quieter than this RMS level are treated as silent (unvoiced) - None disables the gate
+        self.periodicityThreshold = periodicityThreshold #blocks whose YIN confidence (between 0 and 1) is below this are treated as unvoiced - None disables the gate
+
+        self.pitchData = [] #pitch prediction (in Hz) for each block, where unvoiced blocks are given a pitch of 0
+        self.voicingData = [] #whether each block was judged to be voiced (and so had its pitch detected)
 
         self.analysisTime = 0
 
@@ -60,11 +73,16 @@ class PitchProfile:
         log = "Pitch Profile Log for \'%s\'\nLocation: %s\nPitch Detection Algorithm: %s\n    params: %s\nSample rate: %s\nBlock size: %s\n" % (self.name, self.location, self.detectionMode, self.detectionParams, self.sampleRate, self.blockSize)
         if self.instrument != None:
             log += "Instrument: %s\n\n" % (self.instrument)
-        log += "PITCH ANALYSIS (took %ss) - Average Pitch = %sHz\n" % (self.analysisTime, getTrimmedMean(self.pitchData, 0.4))
+        log += "PITCH ANALYSIS (took %ss) - Average Pitch = %sHz\n" % (self.analysisTime, getTrimmedMean([prediction for prediction in self.pitchData if prediction != 0], 0.4))
+
+        #(the pitch info for every voiced block is found at once)
+        pitchData = np.array(self.pitchData)
+        pitchInfos = np.full(len(pitchData), "unvoiced", dtype=object)
+        pitchInfos[pitchData != 0] = getPitchInfo(pitchData[pitchData != 0])
 
         frameCount = 0
-        for prediction in self.pitchData:
-            log += "%s-%s: %s\n" % (frameCount, frameCount+self.blockSize, getPitchInfo(prediction))
+        for pitchInfo in pitchInfos:
+            log += "%s-%s: %s\n" % (frameCount, frameCount+self.blockSize, pitchInfo)
             frameCount += self.blockSize - self.overlap
 
         return log
@@ -87,61 +105,175 @@ class PitchProfile:
 
     def autoCorrectPitchData(self, correctNotes=None):
         '''If correctNotes=None this corrects the frequency values in self.pitchData to be exactly in tune (by the A440 equal temperament tuning standard).
-        If instead correctNotes is an array of the midi values that are 'acceptable' then the frequency values in self.pitchData are tweaked so that they are equal to the frequency of the 'acceptable' midi note that each original pitchData frequency is clsoest to.'''
-        if correctNotes == None:
-            for i in range(len(self.pitchData)):
-                self.pitchData[i] = midiToFreq(round(getMidiNoteWithCents(self.pitchData[i])))
-        else:
-            for i in range(len(self.pitchData)):
-                midiValue = getMidiNoteWithCents(self.pitchData[i])
+        If instead correctNotes is an array of the midi values that are 'acceptable' then the frequency values in self.pitchData are tweaked so that they are equal to the frequency of the 'acceptable' midi note that each original pitchData frequency is clsoest to.
+        Unvoiced blocks (with a pitch of 0) are left as they are.'''
+        pitchData = np.array(self.pitchData)
+        isVoiced = pitchData != 0
+        if np.any(isVoiced):
+            pitchData[isVoiced] = getNearestNoteFreqs(pitchData[isVoiced], correctNotes)
+        self.pitchData = pitchData.tolist()
 
-                closestCorrectValue = correctNotes[0]
-                midiError = abs(closestCorrectValue-midiValue)
-                for note in correctNotes[1:]:
-                    if abs(note-midiValue) < midiError:
-                        midiError = abs(note-midiValue)
-                        closestCorrectValue = note
+    def getDecimationFactor(self):
+        '''Returns the factor by which the signal is decimated before its pitch is analysed - 1 (no decimation) unless isDecimated is True, in which case it is
+        the largest factor that keeps the Nyquist frequency well above the expected maximum frequency (see helpers.getDecimationFactor).'''
+        if not self.isDecimated:
+            return 1
+        return getDecimationFactor(self.sampleRate, self.detectionParams["expectedMax"], self.blockSize, self.blockSize - self.overlap)
 
-                self.pitchData[i] = midiToFreq(closestCorrectValue)
+    def getCandidateFreqs(self):
+        '''Returns the frequencies of the midi notes in detectionParams["candidateNotes"] (e.g. the notes of a scale from helpers.getMajorScale) that lie within the
+        expected frequency range, or None if no candidate notes are given - used by the goertzel detection mode.'''
+        if self.detectionParams.get("candidateNotes") is None:
+            return None
+        freqs = [midiToFreq(note) for note in self.detectionParams["candidateNotes"]]
+        return [freq for freq in freqs if self.detectionParams["expectedMin"] <= freq <= self.detectionParams["expectedMax"]]
 
-    def predictPitch(self, partialSignal):
+    def predictPitch(self, partialSignal, sampleRate=None):
+        '''Returns the pitch prediction for *partialSignal*, whose sample rate is *sampleRate* (by default the sample rate of this object's signal).'''
+        if sampleRate is None:
+            sampleRate = self.sampleRate
         if self.detectionMode == "zerocross":
-            return zerocross(partialSignal, self.sampleRate)
+            return zerocross(partialSignal, sampleRate, self.detectionParams.get("interpolate", True), self.detectionParams.get("hysteresis", 0))
         elif self.detectionMode == "autocorrelation":
-            return autocorrelation(partialSignal, self.sampleRate, self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return autocorrelation(partialSignal, sampleRate, self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("isCustomFFT", False))
         elif self.detectionMode == "AMDF":
-            return AMDF(partialSignal, self.sampleRate, self.detectionParams["b"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return AMDF(partialSignal, sampleRate, self.detectionParams["b"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+        elif self.detectionMode == "yin":
+            return yin(partialSignal, sampleRate, self.detectionParams.get("threshold", 0.1), self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
         elif self.detectionMode == "naiveFT":
-            return naiveFT(partialSignal, self.sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return naiveFT(partialSignal, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("peakInterpolation"))
         elif self.detectionMode == "naiveFTWithPhase":
-            return naiveFTWithPhase(partialSignal, self.sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return naiveFTWithPhase(partialSignal, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
         elif self.detectionMode == "cepstrum":
-            return cepstrum(partialSignal, self.sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return cepstrum(partialSignal, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("peakInterpolation"), self.detectionParams.get("isRealCepstrum", False))
         elif self.detectionMode == "HPS":
-            return HPS(partialSignal, self.sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["numDownsamples"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+            return HPS(partialSignal, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["numDownsamples"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], peakInterpolation=self.detectionParams.get("peakInterpolation"))
+        elif self.detectionMode == "SHS":
+            return SHS(partialSignal, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("numHarmonics", 8), self.detectionParams.get("compression", 0.84), self.detectionParams.get("centResolution", 10))
+        elif self.detectionMode == "goertzel":
+            return goertzel(partialSignal, sampleRate, self.getCandidateFreqs())
         else:
             print("ERROR") #CHANGE THIS SO IT ACTUALLY THROWS AN ERROR
 
 
-    def analysePitch(self):
-        '''returns a list of pitch predictions for each block in this object's signal.'''
-        start = timer()
-        if sf.info(self.location).channels > 1:
-            partialSignals = [toMono(sig) for sig in sf.blocks(self.location, blocksize=self.blockSize, overlap=self.overlap)]
+    def predictPitchBatch(self, frames, sampleRate=None, hopSize=None):
+        '''Returns an array of pitch predictions for each row of the 2-D array *frames* (frames x samples).
+        Algorithms with a batch version analyse all of the frames together, the others analyse them one at a time.
+        If each frame starts *hopSize* samples after the previous one and detectionParams["isSliding"] is True, AMDF slides a SlidingLagDetector along the frames
+        instead of analysing each frame from scratch - as long as the hop is short enough for that to be cheaper (see predict.isSlidingCheaper).
+        Autocorrelation ignores isSliding, since its FFT is always cheaper than sliding.'''
+        if sampleRate is None:
+            sampleRate = self.sampleRate
+        if hopSize is not None and self.detectionParams.get("isSliding", False) and self.detectionMode == "AMDF":
+            if isSlidingCheaper(sampleRate, frames.shape[1], hopSize, self.detectionParams["expectedMin"], self.detectionParams["expectedMax"]):
+                return self.predictPitchSliding(frames, sampleRate, hopSize)
+        if self.detectionMode == "zerocross":
+            return zerocrossBatch(frames, sampleRate, self.detectionParams.get("interpolate", True), self.detectionParams.get("hysteresis", 0))
+        elif self.detectionMode == "yin":
+            return yinBatch(frames, sampleRate, self.detectionParams.get("threshold", 0.1), self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+        elif self.detectionMode == "naiveFT":
+            return naiveFTBatch(frames, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("peakInterpolation"))
+        elif self.detectionMode == "naiveFTWithPhase":
+            return naiveFTWithPhaseBatch(frames, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+        elif self.detectionMode == "cepstrum":
+            return cepstrumBatch(frames, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("peakInterpolation"), self.detectionParams.get("isRealCepstrum", False))
+        elif self.detectionMode == "HPS":
+            return HPSBatch(frames, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["numDownsamples"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], peakInterpolation=self.detectionParams.get("peakInterpolation"))
+        elif self.detectionMode == "SHS":
+            return SHSBatch(frames, sampleRate, self.detectionParams["isCustomFFT"], self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], self.detectionParams.get("numHarmonics", 8), self.detectionParams.get("compression", 0.84), self.detectionParams.get("centResolution", 10))
+        elif self.detectionMode == "goertzel":
+            return goertzelBatch(frames, sampleRate, self.getCandidateFreqs())
         else:
-            partialSignals = sf.blocks(self.location, blocksize=self.blockSize, overlap=self.overlap)
+            return np.array([self.predictPitch(frame, sampleRate) for frame in frames])
+
+    def predictPitchSliding(self, frames, sampleRate, hopSize):
+        '''Returns an array of pitch predictions for each row of the 2-D array *frames*, each of which starts *hopSize* samples after the previous one, using a SlidingLagDetector.'''
+        detector = SlidingLagDetector(sampleRate, frames.shape[1], self.detectionMode, self.detectionParams.get("b", 0.5), self.detectionParams["expectedMin"], self.detectionParams["expectedMax"])
+        predictions = [detector.start(frames[0])]
+        for frame in frames[1:]:
+            predictions.append(detector.slide(frame[-hopSize:]))
+        return np.array(predictions)
+
+    def getVoicing(self, frames, sampleRate):
+        '''Returns a boolean array saying whether each row of *frames* (unwindowed blocks of the signal) is voiced, i.e. has an RMS level of at least self.rmsThreshold
+        and a YIN confidence of at least self.periodicityThreshold - either gate is skipped if its threshold is None.
+        The cheap RMS gate is applied first so that only the blocks which pass it have their periodicity measured.'''
+        isVoiced = np.ones(len(frames), dtype=bool)
+        if self.rmsThreshold is not None:
+            isVoiced &= np.sqrt(np.mean(np.square(frames), axis=1)) >= self.rmsThreshold
+        if self.periodicityThreshold is not None and np.any(isVoiced):
+            confidences = yinBatch(frames[isVoiced], sampleRate, 0.1, self.detectionParams["expectedMin"], self.detectionParams["expectedMax"], True)[1]
+            isVoiced[isVoiced] = np.asarray(confidences) >= self.periodicityThreshold
+        return isVoiced
+
+    def getBlocks(self, decimationFactor=1):
+        '''Yields each (mono) block of this object's signal in turn, as sf.blocks splits it - read one block at a time unless the signal is decimated,
+        in which case the whole signal is decimated at once (so the anti-aliasing filter has no edges at block boundaries) and then split into the same blocks,
+        each decimationFactor times shorter.'''
+        if decimationFactor == 1:
+            for sig in sf.blocks(self.location, blocksize=self.blockSize, overlap=self.overlap, always_2d=True):
+                yield sig.sum(axis=1)
+            return
+
+        signal = decimate(sf.read(self.location, always_2d=True)[0].sum(axis=1), decimationFactor)
+        numSamples = sf.info(self.location).frames
+        for i in range(0, numSamples, self.blockSize - self.overlap):
+            if i == 0 or i + self.overlap < numSamples:
+                yield signal[i//decimationFactor:(i+self.blockSize)//decimationFactor]
+
+    def analyseFrames(self, frames, sampleRate, hopSize, windowFunction):
+        '''Returns the pitch predictions and voicing (see getVoicing()) of each row of the 2-D array *frames* (consecutive full blocks, *hopSize* samples apart),
+        where unvoiced blocks are given a pitch of 0 rather than having their pitch detected.'''
+        isVoiced = self.getVoicing(frames, sampleRate)
+        pitches = np.zeros(len(frames))
+        if np.any(isVoiced):
+            #(sliding detectors rely on every block following on from the last, so they only slide if no block was gated)
+            pitches[isVoiced] = self.predictPitchBatch(frames[isVoiced] * windowFunction, sampleRate, hopSize if np.all(isVoiced) else None)
+        return pitches, isVoiced
+
+    def analysePitch(self, chunkSize=512):
+        '''returns a list of pitch predictions for each block in this object's signal.
+        The blocks are streamed from the file and analysed *chunkSize* at a time (as one frame matrix), so memory use doesn't grow with the length of the signal.'''
+        start = timer()
+        decimationFactor = self.getDecimationFactor()
+        blockSize = self.blockSize//decimationFactor
+        hopSize = (self.blockSize - self.overlap)//decimationFactor
+        sampleRate = self.sampleRate/decimationFactor
+        windowFunction = stretchWindow(self.windowFunction, blockSize)
+        if self.detectionParams.get("isSliding", False) and self.detectionMode == "AMDF" and np.any(windowFunction != 1):
+            raise ValueError("isSliding requires a rectangular window, since windowed blocks no longer share their overlapping samples")
 
         pitchData = []
-        for sig in partialSignals:
-            # print(len(sig))
-            prediction = self.predictPitch([sig[i]*self.windowFunction[i] for i in range(len(sig))])
-            if prediction == 0:
-                prediction = 2.2250738585072014e-308
-            pitchData.append(prediction)
+        voicingData = []
+        chunk = []
+        with useFFTBackend(self.fftBackend, self.fftWorkers):
+            #every block is a full blockSize long except (possibly) the final one, so the full blocks are gathered into chunks that are each analysed as one frame matrix
+            for sig in self.getBlocks(decimationFactor):
+                if len(sig) == blockSize:
+                    chunk.append(sig)
+                    if len(chunk) < chunkSize:
+                        continue
+                if len(chunk) > 0:
+                    pitches, isVoiced = self.analyseFrames(np.array(chunk), sampleRate, hopSize, windowFunction)
+                    pitchData += pitches.tolist()
+                    voicingData += isVoiced.tolist()
+                    chunk = []
+                if len(sig) < blockSize:
+                    isVoiced = bool(self.getVoicing(sig[np.newaxis, :], sampleRate)[0])
+                    pitchData.append(float(self.predictPitch(sig * windowFunction[:len(sig)], sampleRate)) if isVoiced else 0.0)
+                    voicingData.append(isVoiced)
+            if len(chunk) > 0:
+                pitches, isVoiced = self.analyseFrames(np.array(chunk), sampleRate, hopSize, windowFunction)
+                pitchData += pitches.tolist()
+                voicingData += isVoiced.tolist()
+
+        #unvoiced blocks keep a pitch of 0 whereas a voiced block predicted to be 0Hz is nudged up to the smallest positive float (so that its logarithm can still be taken)
+        pitchData = [2.2250738585072014e-308 if isVoiced and prediction == 0 else prediction for prediction, isVoiced in zip(pitchData, voicingData)]
 
         end = timer()
 
         self.pitchData = pitchData
+        self.voicingData = voicingData
         self.analysisTime = end-start
 
     def getSignal(self):
@@ -1,4 +1,4 @@
-from helpers import toMono, proportionClipping, multiplyGain, multiplyGainUntilClipping, resample, getMidiNoteWithCents, getMedian, getHanningWindow
+from helpers import toMono, proportionClipping, multiplyGain, multiplyGainUntilClipping, resample, getMidiNoteWithCents, getMedian, getHanningWindow, getWindow, fft, ifft
 import math, cmath
 import numpy as np 
 import soundfile as sf
@@ -8,12 +8,12 @@ def phase(a):
     phase = cmath.phase(a)
     return phase
 
-def phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlapLength, windowFunction=None):
+def phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlapLength, windowFunction=None, isCustomFFT=False):
     if len(signal) < windowLength:
         print("ERROR") #CHANGE THIS SO IT ACTUALLY THROWS AN ERROR
         return signal
-    if windowFunction == None:
-        windowFunction = [1 for i in range(windowLength)]
+    if windowFunction is None:
+        windowFunction = getWindow("rectangular", windowLength)
 
     hopIn = windowLength - overlapLength
     hopOut = round(hopIn * scalingFactor)
@@ -24,18 +24,17 @@ def phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlap
     finalFrameStartIndex = hopIn * (numFrames-1)
     frameStartIndex = 0
 
-    newSignal = [0 for i in range((numFrames)*hopOut+windowLength)]
+    newSignal = np.zeros((numFrames)*hopOut+windowLength)
 
     freq_vector = np.fft.fftfreq(windowLength, d=1/sampleRate)
 
     #analysis of first frame
     # print(windowLength, len(signal))
-    bins = np.fft.rfft([signal[frameStartIndex+i]*windowFunction[i] for i in range(windowLength)])
+    bins = fft(np.asarray(signal[frameStartIndex:frameStartIndex+windowLength]) * windowFunction, isCustomFFT)
     phaseIn = [phase(a) for a in bins]
     phaseOut = phaseIn
     #synthesis of first frame (no changes made)
-    for i in range(frameStartIndex, frameStartIndex+windowLength):
-        newSignal[i] += signal[i]
+    newSignal[frameStartIndex:frameStartIndex+windowLength] += signal[frameStartIndex:frameStartIndex+windowLength]
 
     #now for the analysis and synthesis of all other frames
     for numFrame in range(1,numFrames):
@@ -43,7 +42,7 @@ def phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlap
         prevPhaseIn = phaseIn
         prevPhaseOut = phaseOut
 
-        bins = np.fft.rfft([signal[frameStartIndex+i]*windowFunction[i] for i in range(windowLength)])
+        bins = fft(np.asarray(signal[frameStartIndex:frameStartIndex+windowLength]) * windowFunction, isCustomFFT)
 
         phaseIn = [phase(a) for a in bins]
         phaseOut = []
@@ -57,21 +56,20 @@ def phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlap
             phaseOut.append(newPhase)
             bins[i] = abs(bins[i])*(math.e**(1j*newPhase))
 
-        newPartialSignal = np.fft.irfft(bins)
+        newPartialSignal = ifft(bins, isCustomFFT)
 
-        for i in range(windowLength):
-            newSignal[i+numFrame*hopOut] += newPartialSignal[i]
+        newSignal[numFrame*hopOut:numFrame*hopOut+windowLength] += newPartialSignal[:windowLength]
 
     if proportionClipping(newSignal) > 0:
         newSignal = multiplyGainUntilClipping(newSignal)
 
     return newSignal
 
-def phaseVocoderPitchShift(signal, sampleRate, scalingFactor, windowLength=2048, overlapLength=1536, windowFunction=None, forceConstantLength=False):
-    newSignal = phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlapLength, windowFunction)
+def phaseVocoderPitchShift(signal, sampleRate, scalingFactor, windowLength=2048, overlapLength=1536, windowFunction=None, forceConstantLength=False, isCustomFFT=False):
+    newSignal = phaseVocoderStretch(signal, sampleRate, scalingFactor, windowLength, overlapLength, windowFunction, isCustomFFT)
     newSignal = resample(newSignal, sampleRate, sampleRate/scalingFactor)
     if forceConstantLength:
-        return phaseVocoderStretch(newSignal, sampleRate, len(signal)/len(newSignal), windowLength, overlapLength, windowFunction)
+        return phaseVocoderStretch(newSignal, sampleRate, len(signal)/len(newSignal), windowLength, overlapLength, windowFunction, isCustomFFT)
     else:
         return newSignal
 
@@ -89,12 +87,31 @@ def compressIndexedPitchData(indexedPitchData):
             sectionStartPitch = indexedPitchData[i][2]
         i += 1
 
+def getVoicedMidiNotes(pitches):
+    '''Returns an array of the midi values of *pitches*, where unvoiced pitches (of 0) are given a midi value of NaN.'''
+    pitches = np.asarray(pitches, dtype=float)
+    midiValues = np.full(len(pitches), np.nan)
+    isVoiced = pitches != 0
+    midiValues[isVoiced] = getMidiNoteWithCents(pitches[isVoiced])
+    return midiValues
+
+def getSectionPitchDifference(midiValue1, midiValue2):
+    '''Returns the difference (in semitones) between two midi values, where NaN marks an unvoiced section - two unvoiced sections are the same (0 difference)
+    whereas an unvoiced and a voiced section are infinitely far apart, so that unvoiced blocks are never merged into voiced sections.'''
+    if math.isnan(midiValue1) or math.isnan(midiValue2):
+        return 0 if math.isnan(midiValue1) and math.isnan(midiValue2) else math.inf
+    return abs(midiValue1 - midiValue2)
+
 def compressIndexedPitchData2(indexedPitchData):
     currentSectionPitches = [indexedPitchData[0][2]]
     deviatingPitches = []
     sectionPitch = indexedPitchData[0][2]
     compressedPitchData = []
 
+    #(the midi values of every block are found at once, leaving just the section's midi value to convert whenever its pitch changes)
+    midiValues = getVoicedMidiNotes([block[2] for block in indexedPitchData]).tolist()
+    sectionMidiValue = midiValues[0]
+
     sectionStartIndex = indexedPitchData[0][0]
     sectionEndIndex = indexedPitchData[0][1]
 
@@ -104,7 +121,7 @@ def compressIndexedPitchData2(indexedPitchData):
 
     while i < len(indexedPitchData):
         # print(i)
-        freqDiff = abs(getMidiNoteWithCents(indexedPitchData[i][2]) - getMidiNoteWithCents(sectionPitch))
+        freqDiff = getSectionPitchDifference(midiValues[i], sectionMidiValue)
         if freqDiff <= 0.25 or abs(freqDiff - 12) <= 0.25:
             currentSectionPitches.append(indexedPitchData[i][2])
             sectionEndIndex = indexedPitchData[i][1]
@@ -115,6 +132,7 @@ def compressIndexedPitchData2(indexedPitchData):
                 sectionPitch = getMedian(currentSectionPitches[1:])
             else:
                 sectionPitch = getMedian(currentSectionPitches)
+            sectionMidiValue = getMidiNoteWithCents(sectionPitch) if sectionPitch != 0 else math.nan
 
         else:
             numDeviatingEstimates += 1
@@ -124,6 +142,7 @@ def compressIndexedPitchData2(indexedPitchData):
                 compressedPitchData.append([sectionStartIndex, sectionEndIndex, sectionPitch])
                 currentSectionPitches = [deviatingPitches[0]]
                 sectionPitch = deviatingPitches[0]
+                sectionMidiValue = getMidiNoteWithCents(sectionPitch) if sectionPitch != 0 else math.nan
                 deviatingPitches = []
 
                 sectionStartIndex = indexedPitchData[i-3][0]
@@ -148,10 +167,12 @@ def removeShortSections(indexedPitchData, minAcceptableSectionLength):
         i += 1
 
 
-def matchPitch(originalPitchProfile, matchingPitchProfile):
+def matchPitch(originalPitchProfile, matchingPitchProfile, isCustomFFT=False):
     '''Takes the signal from *originalPitchProfile* and shifts it in various ways so that the returned signal has a pitch profile that 
     matches that of *matchingPitchProfile
-    NOTE: Requires both pitch profiles to use the same sampleRate'''
+    NOTE: Requires both pitch profiles to use the same sampleRate
+    If *isCustomFFT* is True then the phase vocoder uses customFFT.py rather than numpy for its transforms.
+    Unvoiced sections (with a pitch of 0) of either profile have no pitch to match, so they are passed through unchanged rather than through the phase vocoder.'''
     #get list of major sections where pitch stays stable in each pitchProfile
     #iterate through the profiles and for each new intersection of the above sections calculate the corresponding pitch ratio
     #   -> then use phase vocoder pitch shift on each of these intersections so that the new pitch profile matches the desired profile
@@ -170,10 +191,11 @@ def matchPitch(originalPitchProfile, matchingPitchProfile):
 
     # print(originalIndexedPitchData, matchingIndexedPitchData)
 
-    newSignal = []
+    newSignalSections = [] #(the signal is built up from these sections, which are joined together at the end)
     isMono = sf.info(originalPitchProfile.location).channels == 1
     analysisWindowLength = originalPitchProfile.blockSize//2
     overlap = 3*analysisWindowLength//4
+    analysisWindow = getHanningWindow(analysisWindowLength)
 
     #for each intersection of the newly found 'stable sections' we must now shift the frequency of the original signal to match the matching signal's frequency
     intersectionStartIndex = 0
@@ -185,10 +207,12 @@ def matchPitch(originalPitchProfile, matchingPitchProfile):
         if originalSectionCount == len(originalIndexedPitchData):
             break #reached the end of the original signal
         elif matchingSectionCount == len(matchingIndexedPitchData):
-            newSignal += toMono(sf.read(originalPitchProfile.location, start=intersectionStartIndex, always_2d=True)[0])
+            newSignalSections.append(toMono(sf.read(originalPitchProfile.location, start=intersectionStartIndex, always_2d=True)[0]))
             break #reached the end of the matching signal - no more pitch shifting needs to take place
         else:
-            scalingFactor = matchingIndexedPitchData[matchingSectionCount][2]/originalIndexedPitchData[originalSectionCount][2]
+            originalPitch = originalIndexedPitchData[originalSectionCount][2]
+            matchingPitch = matchingIndexedPitchData[matchingSectionCount][2]
+            isVoiced = originalPitch != 0 and matchingPitch != 0
 
             if originalIndexedPitchData[originalSectionCount][1] < matchingIndexedPitchData[matchingSectionCount][1]:
                 # print("o")
@@ -209,17 +233,22 @@ def matchPitch(originalPitchProfile, matchingPitchProfile):
             if isMono == False:
                 partialSignal = toMono(partialSignal)
             
-            shiftedIntersection = phaseVocoderPitchShift(partialSignal, sampleRate, scalingFactor, windowLength=analysisWindowLength, overlapLength=overlap, windowFunction=getHanningWindow(analysisWindowLength), forceConstantLength=True)
+            if not isVoiced:
+                newSignalSections.append(partialSignal)
+                intersectionStartIndex = intersectionEndIndex
+                continue
+
+            shiftedIntersection = phaseVocoderPitchShift(partialSignal, sampleRate, matchingPitch/originalPitch, windowLength=analysisWindowLength, overlapLength=overlap, windowFunction=analysisWindow, forceConstantLength=True, isCustomFFT=isCustomFFT)
             # print(len(shiftedIntersection), len(partialSignal), intersectionEndIndex-intersectionStartIndex)
-            newSignal += shiftedIntersection
+            newSignalSections.append(shiftedIntersection)
 
             intersectionStartIndex = intersectionEndIndex
 
     
-    return newSignal
+    return np.concatenate(newSignalSections) if newSignalSections else np.zeros(0)
 
-def correctPitch(originalPitchProfile, correctNotes=None):
+def correctPitch(originalPitchProfile, correctNotes=None, isCustomFFT=False):
     correctedPitchProfile = deepcopy(originalPitchProfile)
     correctedPitchProfile.autoCorrectPitchData(correctNotes)
 
-    return matchPitch(originalPitchProfile, correctedPitchProfile)
+    return matchPitch(originalPitchProfile, correctedPitchProfile, isCustomFFT)
@@ -1,6 +1,6 @@
 import sys
-from predict import zerocross, autocorrelation, AMDF, naiveFT, naiveFTWithPhase, cepstrum, HPS
-from helpers import getPitchInfo, getMedian, getTrimmedMean, getHanningWindow, toMono
+from predict import zerocross, autocorrelation, AMDF, yin, naiveFT, naiveFTWithPhase, cepstrum, HPS
+from helpers import getPitchInfo, getMedian, getTrimmedMean, getHanningWindow, toMono, SpectrumContext
 import pitchShift
 from PitchProfile import PitchProfile
 import numpy as np
@@ -54,14 +54,10 @@ def detectPitch(file):
     print("zerocross:        %s     (took %ss)" % (getPitchInfo(pred, True), end-start))
 
     
-    if len(signal) > 1024:
-        start = timer()
-        pred = autocorrelation(signal[:1024], sampleRate)
-        end = timer()
-    else:
-        start = timer()
-        pred = autocorrelation(signal, sampleRate)
-        end = timer()
+    #(autocorrelation is limited to one block, since its sums over every multiple of each lag drift out of phase over a long signal)
+    start = timer()
+    pred = autocorrelation(signal[:8192], sampleRate)
+    end = timer()
     predictions.append(pred)
     executionTimes.append(end-start)
     print("autocorrelation:  %s    (took %ss)" % (getPitchInfo(pred, True), end-start))
@@ -79,28 +75,38 @@ def detectPitch(file):
     print("AMDF:             %s     (took %ss)" % (getPitchInfo(pred, True), end-start))
 
     start = timer()
-    pred = naiveFT(signal, sampleRate, True)
+    pred, confidence = yin(signal, sampleRate, isConfidenceReturned=True)
+    end = timer()
+    predictions.append(pred)
+    executionTimes.append(end-start)
+    print("yin:              %s     (took %ss, confidence %.3f)" % (getPitchInfo(pred, True), end-start, confidence))
+
+    #the frequency-domain algorithms share one SpectrumContext, so the signal's Fourier transform is only computed once (during naiveFT)
+    spectrum = SpectrumContext(signal, sampleRate, True)
+
+    start = timer()
+    pred = naiveFT(signal, sampleRate, True, spectrum=spectrum)
     end = timer()
     predictions.append(pred)
     executionTimes.append(end-start)
     print("naiveFT:          %s     (took %ss)" % (getPitchInfo(pred, True), end-start))
 
     start = timer()
-    pred = naiveFTWithPhase(signal, sampleRate, True)
+    pred = naiveFTWithPhase(signal, sampleRate, True, spectrum=spectrum)
     end = timer()
     predictions.append(pred)
     executionTimes.append(end-start)
     print("naiveFTWithPhase: %s     (took %ss)" % (getPitchInfo(pred, True), end-start))
 
     start = timer()
-    pred = cepstrum(signal, sampleRate, True)
+    pred = cepstrum(signal, sampleRate, True, spectrum=spectrum)
     end = timer()
     predictions.append(pred)
     executionTimes.append(end-start)
     print("cepstrum:         %s     (took %ss)" % (getPitchInfo(pred, True), end-start))
 
     start = timer()
-    pred = HPS(signal, sampleRate, True, 2)
+    pred = HPS(signal, sampleRate, True, 2, spectrum=spectrum)
     end = timer()
     predictions.append(pred)
     executionTimes.append(end-start)
@@ -109,11 +115,11 @@ def detectPitch(file):
     
     print("median:           %s     (took %ss)" % (getPitchInfo(getMedian(predictions), True), sum(executionTimes)))
 
-    print("mean of middle 3: %s     (took %ss)" % (getPitchInfo(getTrimmedMean(predictions, 2/7), True), sum(executionTimes)))
+    print("mean of middle 4: %s     (took %ss)" % (getPitchInfo(getTrimmedMean(predictions, 2/8), True), sum(executionTimes)))
 
 def correctPitch(inputFile, outputFile):
     sampleRate = sf.info(inputFile).samplerate
-    pp = PitchProfile(inputFile, sampleRate, "naiveFT", {"isCustomFFT" : True}, blockSize=4096, overlap=0)
+    pp = PitchProfile(inputFile, sampleRate, "yin", {"threshold" : 0.1}, blockSize=4096, overlap=0)
     pp.analysePitch()
     # pp.printLog()
     newSignal = pitchShift.correctPitch(pp)
@@ -126,11 +132,11 @@ def matchPitch(inputFile, matchingFile, outputFile):
         print("Input file and matching file must have the same sample rate.")
         return
 
-    pp1 = PitchProfile(inputFile, sampleRateIn, "naiveFTWithPhase", {"isCustomFFT" : True}, blockSize=8192, overlap=0)
+    pp1 = PitchProfile(inputFile, sampleRateIn, "yin", {"threshold" : 0.1}, blockSize=8192, overlap=0)
     pp1.analysePitch()
     # print(pp1.pitchData)
     # pp1.printLog()
-    pp2 = PitchProfile(matchingFile, sampleRateIn, "naiveFTWithPhase", {"isCustomFFT" : True}, blockSize=8192, overlap=0)
+    pp2 = PitchProfile(matchingFile, sampleRateIn, "yin", {"threshold" : 0.1}, blockSize=8192, overlap=0)
     pp2.analysePitch()
     # print(pp2.pitchData)
     # pp2.printLog()
@@ -1,280 +1,738 @@
 import customFFT
-import math, cmath
-from helpers import resample, getTrimmedMean, getMidiNoteWithCents, fft
+import math
+from helpers import getTrimmedMean, fft, ifft, SpectrumContext, getFreqVector
 import numpy as np 
+from functools import lru_cache
+
+try:
+    from scipy.sparse import csr_matrix
+except ImportError:
+    csr_matrix = None
+
+#### DETECTOR PLANS
+# Everything an algorithm needs that depends only on the frame length, sample rate and expected frequency range (and not on the signal itself)
+# is worked out once and kept in a DetectorPlan, so analysing many equal-length frames (e.g. in a PitchProfile) has no per-frame setup.
+
+class DetectorPlan:
+    '''Precomputed frequency/quefrency vectors, bin (or lag) bounds, downsampling slices and analysis windows for running *algorithm* on frames of N samples.
+    Use getDetectorPlan() rather than creating these directly so that plans are shared between calls.'''
+    def __init__(self, N, sampleRate, expectedMin, expectedMax, algorithm):
+        self.N = N
+        self.sampleRate = sampleRate
+        self.expectedMin = expectedMin
+        self.expectedMax = expectedMax
+        self.algorithm = algorithm
+
+        if algorithm in ("autocorrelation", "AMDF"):
+            #only lags within the expected frequency range are considered
+            self.minLag = max(1, math.ceil(sampleRate/expectedMax))
+            self.maxLag = min(N//2 + 1, math.ceil(sampleRate/expectedMin)) #exclusive
+            self.lags = np.arange(self.minLag, max(self.minLag, self.maxLag))
+
+            #each lag m is scored using every multiple of m - these are all concatenated (with the offset of each lag's multiples)
+            #so that the scores of all lags can be found with a single np.add.reduceat
+            multiples = [np.arange(m, N, m) for m in self.lags]
+            self.multipleIndices = np.concatenate(multiples) if len(multiples) > 0 else np.zeros(0, dtype=int)
+            self.multipleOffsets = np.cumsum([0] + [len(x) for x in multiples[:-1]]).astype(int)
+            self.requiredLags = np.unique(self.multipleIndices)
+
+            #zero-pad to at least 2N-1 samples so that the (circular) correlation given by the FFT is the same as the linear one (kept even for the real inverse transform)
+            self.paddedLength = 2*customFFT.nextFastSize(N)
+            return
+
+        if algorithm == "yin":
+            #every lag is compared over the same integration window of the first windowLength samples, so the difference function is needed up to
+            #(and including, for the parabolic refinement) maxLag - lags are limited to half the frame so that the window is never shorter than the largest lag
+            self.minLag = max(1, math.ceil(sampleRate/expectedMax))
+            self.maxLag = min(N//2, math.ceil(sampleRate/expectedMin)) #exclusive
+            self.windowLength = N - self.maxLag
+            self.lagIndices = np.arange(self.maxLag + 1)
+
+            #the correlation of the window with the frame never wraps around a circular FFT of at least N samples (kept even for the real inverse transform)
+            self.paddedLength = 2*customFFT.nextFastSize(math.ceil(N/2))
+            return
+
+        if algorithm == "naiveFTWithPhase":
+            #First find the ideal FT window size (the largest length the FFT handles efficiently), assuming a 75% overlap in the two windows.
+            self.windowLength = customFFT.previousFastSize(math.floor(N*0.8))
+            self.windows = ((0, self.windowLength), (self.windowLength//4, self.windowLength + self.windowLength//4))
+        else:
+            self.windowLength = N
+            self.windows = ((0, None),)
+
+        self.freqVector = getFreqVector(self.windowLength, sampleRate)
+        minExpectedBin, maxExpectedBin = getExpectedBinRange(self.freqVector, expectedMin, expectedMax)
+        self.minBin = max(1, minExpectedBin)
+        self.maxBin = maxExpectedBin
+
+        if algorithm == "cepstrum":
+            self.quefrencies = np.fft.rfftfreq(len(self.freqVector), d=self.freqVector[1]-self.freqVector[0])
+            self.quefrencies.flags.writeable = False
+            minExpectedBin, maxExpectedBin = getExpectedBinRange(self.quefrencies, 1/expectedMax, 1/expectedMin)
+            self.minQuefrencyBin = max(5, minExpectedBin)
+            self.maxQuefrencyBin = maxExpectedBin
+
+            #the real cepstrum is indexed by lag (in samples) instead, up to half the frame length - the lowest lags (as with the lowest quefrency bins above) hold the
+            #spectral envelope rather than the pitch, so are skipped
+            self.minCepstrumLag = max(10, math.ceil(sampleRate/expectedMax))
+            self.maxCepstrumLag = min(N//2, math.floor(sampleRate/expectedMin))
+
+        if algorithm == "HPS":
+            #downsampling the spectrum by a factor of i keeps every ith bin (up to, but not including, the final bin) - downsampleSlices[i-1] selects these bins
+            numBins = len(self.freqVector)
+            self.downsampleSlices = [slice(0, numBins-1, i) for i in range(1, numBins)]
+
+@lru_cache(maxsize=128)
+def getDetectorPlan(N, sampleRate, expectedMin, expectedMax, algorithm):
+    '''Returns the (memoised) DetectorPlan for running *algorithm* on frames of N samples - the least recently used plans are discarded once 128 are held.'''
+    return DetectorPlan(N, sampleRate, expectedMin, expectedMax, algorithm)
+
+def getExpectedBinRange(freq_vector, expectedMin, expectedMax):
+    '''Returns the first and last bins of *freq_vector* that lie within the range [*expectedMin*, *expectedMax*]
+    (or 1 and len(freq_vector) respectively if there are no such bins).'''
+    expectedBins = np.flatnonzero(freq_vector >= expectedMin)
+    if len(expectedBins) == 0:
+        minExpectedBin = 1
+    else:
+        minExpectedBin = expectedBins[0]
 
-#### TIME-DOMAIN ALGORITHMS
+    expectedBins = np.flatnonzero(freq_vector <= expectedMax)
+    if len(expectedBins) == 0:
+        maxExpectedBin = len(freq_vector)
+    else:
+        maxExpectedBin = expectedBins[-1]
 
-def zerocross(signal, sampleRate):
-    '''Zero-Crossing Pitch Detection
-    Predicts the frequency of a mono signal by estimating the average period given by points where the signal changes sign (-ve/+ve).'''
+    return minExpectedBin, maxExpectedBin
 
-    firstZeroCrossIndex = -1
-    lastZeroCrossIndex = len(signal)
-    zeroCrossCount = 0
-    isPositive = (signal[0] > 0)
+#### TIME-DOMAIN ALGORITHMS
 
-    for index, sample in enumerate(signal):
-        if (sample > 0) != isPositive:
-            zeroCrossCount += 1
-            isPositive = not isPositive
+def zerocross(signal, sampleRate, interpolate=True, hysteresis=0):
+    '''Zero-Crossing Pitch Detection
+    Predicts the frequency of a mono signal by estimating the average period given by points where the signal changes sign (-ve/+ve).
+    If *interpolate* is True each crossing is placed between its two samples by linear interpolation (rather than at the later sample), giving sub-sample period resolution.
+    If *hysteresis* > 0 the signal must pass beyond +/-*hysteresis* before a change of sign is counted, so small noisy wobbles around zero are not counted as crossings.'''
+    return zerocrossBatch(np.asarray(signal)[np.newaxis], sampleRate, interpolate, hysteresis)[0]
+
+def zerocrossBatch(frames, sampleRate, interpolate=True, hysteresis=0):
+    '''Zero-Crossing Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    frames = np.asarray(frames, dtype=float)
+    N = frames.shape[1]
+
+    #the state of each sample is +1 (positive) or -1 (negative) and a crossing happens at each index whose state differs from the sample before it
+    if hysteresis > 0:
+        #samples within +/-hysteresis are 0 and take the state of the last sample outside of this band (a Schmitt trigger) - samples before any such sample stay 0 and never cross
+        states = np.where(frames > hysteresis, 1, np.where(frames < -hysteresis, -1, 0))
+        lastSetIndices = np.maximum.accumulate(np.where(states != 0, np.arange(N), 0), axis=1)
+        states = np.take_along_axis(states, lastSetIndices, axis=1)
+        crossings = (states[:, 1:] != states[:, :-1]) & (states[:, :-1] != 0)
+    else:
+        states = np.where(frames > 0, 1, -1)
+        crossings = states[:, 1:] != states[:, :-1]
+    zeroCrossCount = np.sum(crossings, axis=1)
+
+    if interpolate:
+        #the crossing between samples i-1 and i is where the line between them passes the threshold that was crossed (+hysteresis when rising, -hysteresis when falling)
+        before = frames[:, :-1]
+        thresholds = hysteresis*states[:, 1:]
+        offsets = np.divide(before - thresholds, before - frames[:, 1:], out=np.zeros(crossings.shape), where=crossings)
+        crossPositions = np.arange(N-1) + offsets
+    else:
+        crossPositions = np.broadcast_to(np.arange(1, N), crossings.shape)
 
-            if firstZeroCrossIndex == -1:
-                firstZeroCrossIndex = index
-            else:
-                lastZeroCrossIndex = index
+    #as in the original sample-by-sample version the first position defaults to -1 (no crossings) and the last to N (fewer than two crossings)
+    rows = np.arange(len(frames))
+    firstZeroCrossIndex = np.where(zeroCrossCount > 0, crossPositions[rows, np.argmax(crossings, axis=1)], -1)
+    lastZeroCrossIndex = np.where(zeroCrossCount > 1, crossPositions[rows, N - 2 - np.argmax(crossings[:, ::-1], axis=1)], N)
 
     return sampleRate*0.5*(zeroCrossCount-1)/(lastZeroCrossIndex-firstZeroCrossIndex)
 
-def autocorrelation(signal, sampleRate, expectedMin=20, expectedMax=20000):
+def autocorrelation(signal, sampleRate, expectedMin=20, expectedMax=20000, isCustomFFT=False):
     '''Autocorrelation Pitch Detection
     Predicts the frequency of a mono signal by finding the time interval (of m samples) for which the signal most consistently repeats itself.
-    Autocorrelation uses the product of signal values at intervals of m samples to find this optimal m.'''
-
-    maxComparisionDistance = len(signal) // 2
-
-    #each mth bin corresponds to the autocorrelation sum:- sum of x(i)x(i+m) forall i
-    bins = [0 for i in range(maxComparisionDistance+1)]
-    binCounts = [0 for i in range(maxComparisionDistance+1)]
+    Autocorrelation uses the product of signal values at intervals of m samples to find this optimal m.
+    The products for every lag are found at once from the power spectrum of the zero-padded signal (the Wiener-Khinchin theorem), rather than by comparing each pair of samples directly.'''
 
-    for signalIndex in range(len(signal)):
-        for m in range(1, maxComparisionDistance+1):
-            sum = 0
-            counter = 0
+    plan = getDetectorPlan(len(signal), sampleRate, expectedMin, expectedMax, "autocorrelation")
+    if len(plan.lags) == 0:
+        return sampleRate
 
-            
-            i = 1
-            while (signalIndex + i * m) < len(signal):
-                sum += signal[signalIndex] * signal[signalIndex + i*m]
-                counter += 1
-                binCounts[m] += 1
+    return getAutocorrelationPrediction(getAutocorrelationLagSums(signal, plan, isCustomFFT), plan)
 
-                i += 1
+def getAutocorrelationLagSums(signal, plan, isCustomFFT=False):
+    '''Returns the array whose lth element is the sum of x(i)x(i+l) forall i, for every lag l of a frame of plan.N samples
+    (using customFFT.py if *isCustomFFT* is True, otherwise the selected FFT backend).'''
+    padded = np.zeros(plan.paddedLength)
+    padded[:plan.N] = signal
+    bins = fft(padded, isCustomFFT)
+    return ifft(bins.real**2 + bins.imag**2, isCustomFFT)[:plan.N]
 
-            bins[m] += sum
+def getAutocorrelationPrediction(lagSums, plan):
+    #each mth bin corresponds to the autocorrelation sum:- sum of x(i)x(i+k*m) forall i and all k >= 1, i.e. the lag sums at every multiple of m
+    correlations = np.add.reduceat(lagSums[plan.multipleIndices], plan.multipleOffsets)
 
-    maxCorrelation = -float("inf")
-    maxM = 1
-    for m in range(max(1, math.ceil(sampleRate/expectedMax)), min(maxComparisionDistance+1, math.ceil(sampleRate/expectedMin))):
-        if bins[m] > maxCorrelation:
-            maxCorrelation = bins[m]
-            maxM = m
-
-    return sampleRate / maxM
+    return plan.sampleRate / plan.lags[np.argmax(correlations)]
 
 def AMDF(signal, sampleRate, b=0.5, expectedMin=20, expectedMax=20000):
     '''Average Magnitude Differential Function Pitch Detection
     Predicts the frequency of a mono signal by finding the time interval (of m samples) for which the signal most consistently repeats itself.
-    AMDF uses the Euclidean distance (to the power of b) between signal values at intervals of m samples to find this optimal m.'''
-
-    maxComparisionDistance = len(signal) // 2
-
-    #each mth bin corresponds to the autocorrelation sum:- sum of x(i)x(i+m) forall i
-    bins = [0 for i in range(maxComparisionDistance+1)]
-    binCounts = [0 for i in range(maxComparisionDistance+1)]
-
-    for signalIndex in range(len(signal)):
-        for m in range(1, maxComparisionDistance+1):
-            sum = 0
-            counter = 0
-
-            
-            i = 1
-            while (signalIndex + i * m) < len(signal):
-                sum += (abs(signal[signalIndex] - signal[signalIndex + i*m]))**b
-                counter += 1
-                binCounts[m] += 1
-
-                i += 1
-
-            bins[m] += sum
-
-    # print(bins)
-    minCorrelation = bins[1]/binCounts[1]
-    minM = 1
-    for m in range(max(1, math.ceil(sampleRate/expectedMax)), min(maxComparisionDistance+1, math.ceil(sampleRate/expectedMin))):
-        if bins[m]/binCounts[m] < minCorrelation:
-            minCorrelation = bins[m]/binCounts[m]
-            minM = m
-
-    return sampleRate / minM
+    AMDF uses the Euclidean distance (to the power of b) between signal values at intervals of m samples to find this optimal m.
+    *b* may also be given as a list of exponents, in which case a list of predictions (one per exponent) is returned - the absolute differences are then only computed once and shared between all exponents.'''
+
+    isSingleExponent = np.ndim(b) == 0
+    exponents = [b] if isSingleExponent else list(b)
+
+    signal = np.asarray(signal, dtype=float)
+    plan = getDetectorPlan(len(signal), sampleRate, expectedMin, expectedMax, "AMDF")
+    if len(plan.lags) == 0:
+        predictions = [sampleRate for exponent in exponents]
+        return predictions[0] if isSingleExponent else predictions
+
+    predictions = getAMDFPredictions(getAMDFLagSums(signal, plan, exponents), plan)
+
+    return predictions[0] if isSingleExponent else predictions
+
+def getAMDFLagSums(signal, plan, exponents):
+    '''Returns the (exponents x plan.N) array whose [e, l] element is the sum of |x(i)-x(i+l)|^exponents[e] forall i, for every lag l that some lag of the plan is a multiple of (others are 0).'''
+    #each mth bin corresponds to the sum of |x(i)-x(i+k*m)|^b forall i and all k >= 1,
+    #so the sum for each lag l (over every i) is needed for every multiple l of the lags m being considered
+    lagSums = np.zeros((len(exponents), plan.N))
+    for l in plan.requiredLags:
+        absDiffs = np.abs(signal[l:] - signal[:-l])
+        for exponentIndex, exponent in enumerate(exponents):
+            lagSums[exponentIndex, l] = np.sum(absDiffs**exponent)
+    return lagSums
+
+def getAMDFPredictions(lagSums, plan):
+    '''Returns the list of predictions given by each row of the lag sums from getAMDFLagSums().'''
+    bins = np.add.reduceat(lagSums[:, plan.multipleIndices], plan.multipleOffsets, axis=1)
+    binCounts = np.add.reduceat(plan.N - plan.multipleIndices, plan.multipleOffsets)
+    return [plan.sampleRate / m for m in plan.lags[np.argmin(bins/binCounts, axis=1)]]
+
+class SlidingLagDetector:
+    '''Stateful autocorrelation or AMDF (*algorithm*) pitch detector for a stream of overlapping frames of *blockSize* samples, e.g. the blocks of a PitchProfile.
+    Rather than recomputing every lag sum for each frame, the sums are updated as the frame slides along by removing the terms of the pairs of samples that leave the frame
+    and adding those of the pairs that enter it - so each hop of H samples costs O(H x lags) instead of a whole frame's worth of work.
+    Call start() with the first frame and then slide() with the next H samples for each following frame. To stop rounding errors building up, the sums are recomputed from scratch
+    every *resyncInterval* hops. Note that the frames must not be windowed (other than by a rectangular window), since windowed frames no longer share their overlapping samples.
+    Every multiple of every lag in range is needed, which is nearly every lag up to blockSize, so sliding only pays off for hops much shorter than the frame (see isSlidingCheaper())
+    - and never for autocorrelation, whose FFT recomputation is far cheaper than either.'''
+    def __init__(self, sampleRate, blockSize, algorithm="autocorrelation", b=0.5, expectedMin=20, expectedMax=20000, resyncInterval=64):
+        if algorithm not in ("autocorrelation", "AMDF"):
+            raise ValueError("SlidingLagDetector only supports 'autocorrelation' and 'AMDF', not '%s'" % algorithm)
+        self.algorithm = algorithm
+        self.b = b
+        self.resyncInterval = resyncInterval
+        self.plan = getDetectorPlan(blockSize, sampleRate, expectedMin, expectedMax, algorithm)
+
+        self.frame = None
+        self.lagSums = None
+        self.hopsSinceResync = 0
+        self.hopMasks = {}
+
+    def start(self, frame):
+        '''Sets the current frame to *frame* (computing all of its lag sums) and returns its prediction.'''
+        self.frame = np.array(frame, dtype=float)
+        if self.algorithm == "autocorrelation":
+            self.lagSums = getAutocorrelationLagSums(self.frame, self.plan)
+        else:
+            self.lagSums = getAMDFLagSums(self.frame, self.plan, [self.b])[0]
+        self.hopsSinceResync = 0
+        return self.predict()
+
+    def slide(self, newSamples):
+        '''Moves the current frame along by len(*newSamples*) samples (dropping its oldest samples and appending *newSamples*) and returns the new frame's prediction.'''
+        newSamples = np.asarray(newSamples, dtype=float)
+        H = len(newSamples)
+        N = self.plan.N
+        extended = np.concatenate((self.frame, newSamples))
+        self.frame = extended[H:]
+
+        self.hopsSinceResync += 1
+        if H >= N or self.hopsSinceResync >= self.resyncInterval:
+            return self.start(self.frame)
+
+        #the old frame's pairs (i, i+l) for i = 0, ..., N-l-1 become those for i = H, ..., N-l-1+H (indices within the extended signal), so the pairs (i, i+l) for the first H values of i
+        #leave and those (N-l+j, N+j) for the first H values of j enter (though, for lags l > N-H, only those pairs which were/are actually within the old/new frame)
+        #- each group of H samples is a row of the sliding windows view, so gathering them copies whole rows rather than individual samples
+        lags = self.plan.requiredLags
+        windows = np.lib.stride_tricks.sliding_window_view(extended, H)
+        leavingMask, enteringMask = self.getHopMasks(H)
+        leavingTerms = self.getPairTerms(extended[:H], windows[lags])
+        enteringTerms = self.getPairTerms(windows[N - lags], extended[N:])
+
+        self.lagSums[lags] += np.sum(enteringTerms*enteringMask, axis=1) - np.sum(leavingTerms*leavingMask, axis=1)
+
+        return self.predict()
+
+    def getHopMasks(self, H):
+        '''Returns the (memoised) (lags x H) masks of which leaving and entering pairs (see slide()) are actually within the old and new frames respectively for a hop of H samples.'''
+        if H not in self.hopMasks:
+            offsets = np.arange(H)
+            remainingLengths = (self.plan.N - self.plan.requiredLags)[:, np.newaxis]
+            self.hopMasks[H] = (offsets < remainingLengths, remainingLengths + offsets >= H)
+        return self.hopMasks[H]
+
+    def getPairTerms(self, firsts, seconds):
+        '''Returns the terms that the pairs of samples (*firsts*, *seconds*) contribute to their lag sums.'''
+        if self.algorithm == "autocorrelation":
+            return firsts*seconds
+        return np.abs(firsts - seconds)**self.b
+
+    def predict(self):
+        '''Returns the prediction for the current frame.'''
+        if len(self.plan.lags) == 0:
+            return self.plan.sampleRate
+        if self.algorithm == "autocorrelation":
+            return getAutocorrelationPrediction(self.lagSums, self.plan)
+        return getAMDFPredictions(self.lagSums[np.newaxis], self.plan)[0]
+
+def isSlidingCheaper(sampleRate, blockSize, hopSize, expectedMin=20, expectedMax=20000):
+    '''Returns True if sliding a SlidingLagDetector for AMDF along frames *hopSize* samples apart is cheaper than recomputing each frame's lag sums from scratch.
+    Each hop costs a leaving and an entering term for every required lag, against N-l terms per required lag l for a recomputation - and since each sliding term
+    takes more work (and memory) than a recomputed one, sliding must need under half as many terms.'''
+    plan = getDetectorPlan(blockSize, sampleRate, expectedMin, expectedMax, "AMDF")
+    return 2*hopSize*len(plan.requiredLags) < 0.5*np.sum(plan.N - plan.requiredLags)
+
+def yin(signal, sampleRate, threshold=0.1, expectedMin=20, expectedMax=20000, isConfidenceReturned=False):
+    '''YIN Pitch Detection (de Cheveigné & Kawahara, 2002)
+    Predicts the frequency of a mono signal from the smallest lag m (in samples) at which the signal's cumulative-mean-normalised squared difference from itself drops below *threshold*.
+    Unlike AMDF's raw differences, the normalisation penalises the small lags that would cause octave errors, and the lag is refined between samples by parabolic interpolation.
+    If *isConfidenceReturned* is True then a (prediction, confidence) pair is returned, where the confidence is 1 - the normalised difference at the chosen lag (its aperiodicity).'''
+    predictions, confidences = yinBatch(np.asarray(signal)[np.newaxis], sampleRate, threshold, expectedMin, expectedMax, True)
+    if isConfidenceReturned:
+        return predictions[0], confidences[0]
+    return predictions[0]
+
+def yinBatch(frames, sampleRate, threshold=0.1, expectedMin=20, expectedMax=20000, isConfidenceReturned=False):
+    '''YIN Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame (and an array of confidences if *isConfidenceReturned* is True).'''
+    frames = np.asarray(frames, dtype=float)
+    plan = getDetectorPlan(frames.shape[1], sampleRate, expectedMin, expectedMax, "yin")
+    if plan.maxLag <= plan.minLag:
+        predictions, confidences = np.full(len(frames), float(sampleRate)), np.zeros(len(frames))
+        return (predictions, confidences) if isConfidenceReturned else predictions
+
+    #the difference function d(m) = sum of (x(i)-x(i+m))^2 over the window expands to (window energy) + (energy of the window shifted by m) - 2*(correlation at lag m),
+    #where the correlations for every lag come from one FFT (rather than comparing each pair of samples directly) and the energies from a cumulative sum
+    W = plan.windowLength
+    padded = np.zeros((len(frames), plan.paddedLength))
+    padded[:, :plan.N] = frames
+    paddedWindow = np.zeros((len(frames), plan.paddedLength))
+    paddedWindow[:, :W] = frames[:, :W]
+    correlations = ifft(np.conj(fft(paddedWindow, False)) * fft(padded, False), False)[:, plan.lagIndices]
+
+    cumulativeEnergies = np.concatenate((np.zeros((len(frames), 1)), np.cumsum(frames**2, axis=1)), axis=1)
+    shiftedEnergies = cumulativeEnergies[:, plan.lagIndices + W] - cumulativeEnergies[:, plan.lagIndices]
+    differences = np.maximum(cumulativeEnergies[:, W:W+1] + shiftedEnergies - 2*correlations, 0)
+
+    #cumulative mean normalisation: d'(m) = d(m) / (mean of d(1), ..., d(m)), with d'(0) = 1
+    cumulativeMeans = np.cumsum(differences[:, 1:], axis=1) / plan.lagIndices[1:]
+    normalised = np.ones(differences.shape)
+    np.divide(differences[:, 1:], cumulativeMeans, out=normalised[:, 1:], where=cumulativeMeans > 0)
+
+    #absolute threshold: take the first lag in range below the threshold and follow it down to its local minimum
+    #(frames with no lag below the threshold use the lag with the smallest normalised difference instead)
+    expectedNormalised = normalised[:, plan.minLag:plan.maxLag]
+    isBelowThreshold = expectedNormalised < threshold
+    firstBelow = np.argmax(isBelowThreshold, axis=1)
+    isRising = normalised[:, plan.minLag+1:plan.maxLag+1] >= expectedNormalised
+    isLocalMin = isRising & (np.arange(expectedNormalised.shape[1]) >= firstBelow[:, np.newaxis])
+    localMins = np.where(np.any(isLocalMin, axis=1), np.argmax(isLocalMin, axis=1), expectedNormalised.shape[1] - 1)
+    lags = plan.minLag + np.where(np.any(isBelowThreshold, axis=1), localMins, np.argmin(expectedNormalised, axis=1))
+
+    #parabolic interpolation through the normalised differences either side of each lag gives the sub-sample position of the minimum
+    rows = np.arange(len(frames))
+    before, centre, after = normalised[rows, lags-1], normalised[rows, lags], normalised[rows, lags+1]
+    curvatures = before - 2*centre + after
+    shifts = np.divide(before - after, 2*curvatures, out=np.zeros(len(frames)), where=curvatures > 0)
+    predictions = sampleRate / (lags + np.clip(shifts, -1, 1))
+
+    if isConfidenceReturned:
+        return predictions, np.clip(1 - centre, 0, 1)
+    return predictions
 
 #### FREQUENCY-DOMAIN ALGORITHMS
+# Each algorithm has a 'Batch' version taking a 2-D array of equal-length frames (frames x samples) and returning an array of predictions (one per frame),
+# so that all frames share one (batched) Fourier transform. The single-frame versions simply run their batch version on a single frame.
+# All of them may also be given a SpectrumContext (see helpers.py) for their frame(s), letting several algorithms share the same transform - *frames* is then ignored.
+
+def pickPeakBins(values, minBin, maxBin, defaultBin=1):
+    '''Returns, for each row of the 2-D array *values*, the index of its largest value between bins *minBin* and *maxBin* (inclusive).
+    Rows without any positive value in this range give *defaultBin* instead.'''
+    expectedValues = values[:, minBin:maxBin+1]
+    if expectedValues.shape[1] == 0:
+        return np.full(len(values), defaultBin)
+
+    peakBins = np.argmax(expectedValues, axis=1)
+    peakValues = expectedValues[np.arange(len(values)), peakBins]
+
+    return np.where(peakValues > 0, minBin + peakBins, defaultBin)
+
+def pickTopTwoPeakBins(values, minBin, maxBin, defaultBin=1):
+    '''Returns two arrays giving, for each row of the 2-D array *values*, the indices of its largest and second largest values between bins *minBin* and *maxBin* (inclusive).
+    As in pickPeakBins, a peak whose value is not positive is given as *defaultBin* instead.'''
+    expectedValues = values[:, minBin:maxBin+1]
+    if expectedValues.shape[1] < 2:
+        return pickPeakBins(values, minBin, maxBin, defaultBin), np.full(len(values), defaultBin)
+
+    #argpartition finds the two largest values of each row without sorting the rest, they are then ordered by value (and then by bin, so ties go to the lower bin)
+    frameIndices = np.arange(len(values))[:, np.newaxis]
+    topTwoBins = np.sort(np.argpartition(expectedValues, -2, axis=1)[:, -2:], axis=1)
+    topTwoValues = expectedValues[frameIndices, topTwoBins]
+    isSwapped = topTwoValues[:, 1] > topTwoValues[:, 0]
+    topTwoBins[isSwapped] = topTwoBins[isSwapped, ::-1]
+    topTwoValues[isSwapped] = topTwoValues[isSwapped, ::-1]
+
+    topTwoBins = np.where(topTwoValues > 0, minBin + topTwoBins, defaultBin)
+    return topTwoBins[:, 0], topTwoBins[:, 1]
+
+def refinePeakBins(values, peakBins, peakInterpolation, bins=None):
+    '''Returns the (fractional) positions of the peaks at *peakBins* in the rows of the 2-D array *values* (e.g. magnitudes), refined between bins by *peakInterpolation*:
+        None        - no refinement, i.e. the peak bins themselves
+        "parabolic" - the vertex of the parabola through the log-values of each peak and its two neighbours
+        "jacobsen"  - Jacobsen's estimator, using the complex *bins* that the values were taken from
+        "quinn"     - Quinn's (first) estimator, using the complex *bins* that the values were taken from
+    "parabolic" suits tapered windows (e.g. Hanning) whereas "jacobsen" and "quinn" are derived for (and most accurate with) rectangular windows.
+    "jacobsen" and "quinn" fall back to "parabolic" when there are no complex *bins* (e.g. for a harmonic product spectrum). Peaks in the first or last bin are not refined.'''
+    if peakInterpolation is None:
+        return peakBins
+    elif peakInterpolation not in ("parabolic", "jacobsen", "quinn"):
+        raise ValueError("unknown peak interpolation '%s' (should be None, 'parabolic', 'jacobsen' or 'quinn')" % peakInterpolation)
+
+    frameIndices = np.arange(len(values))
+    isInterior = (peakBins > 0) & (peakBins < values.shape[1]-1)
+    centreBins = np.where(isInterior, peakBins, 1) #(edge peaks use placeholder neighbours, their offsets are discarded below)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if bins is None or peakInterpolation == "parabolic":
+            before, centre, after = [np.log(np.maximum(values[frameIndices, centreBins + i], np.finfo(float).tiny)) for i in (-1, 0, 1)]
+            offsets = 0.5*(before - after)/(before - 2*centre + after)
+        else:
+            before, centre, after = [bins[frameIndices, centreBins + i] for i in (-1, 0, 1)]
+            if peakInterpolation == "jacobsen":
+                offsets = np.real((before - after)/(2*centre - before - after))
+            else:
+                #Quinn takes the offset towards whichever neighbour's ratio to the peak suggests the true frequency lies on its side
+                beforeRatio = np.real(before/centre)
+                afterRatio = np.real(after/centre)
+                beforeOffset = beforeRatio/(1 - beforeRatio)
+                afterOffset = -afterRatio/(1 - afterRatio)
+                offsets = np.where((beforeOffset > 0) & (afterOffset > 0), afterOffset, beforeOffset)
 
-def naiveFT(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000):
-    '''A Naive Fourier-Transform Pitch Detection Method
-    Predicts the frequency of a mono signal simply by picking the largest peak in the  Fourier-transform of the signal.'''
-
-    freq_vector = np.fft.rfftfreq(len(signal), d=1/sampleRate)
+    offsets = np.where(isInterior & np.isfinite(offsets), np.clip(offsets, -0.5, 0.5), 0)
+    return peakBins + offsets
 
-    expectedBins = np.where(freq_vector >= expectedMin)[0]
-    if len(expectedBins) == 0:
-        minExpectedBin = 1
-    else:
-        minExpectedBin = min(expectedBins)
+def naiveFT(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, peakInterpolation=None, spectrum=None):
+    '''A Naive Fourier-Transform Pitch Detection Method
+    Predicts the frequency of a mono signal simply by picking the largest peak in the  Fourier-transform of the signal.
+    The peak may be refined to a position between bins with *peakInterpolation* (see refinePeakBins).'''
+    return naiveFTBatch(np.asarray(signal)[np.newaxis], sampleRate, isCustomFFT, expectedMin, expectedMax, peakInterpolation, spectrum)[0]
 
-    expectedBins = np.where(freq_vector <= expectedMax)[0]
-    if len(expectedBins) == 0:
-        maxExpectedBin = len(freq_vector)
-    else:
-        maxExpectedBin = max(expectedBins)
+def naiveFTBatch(frames, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, peakInterpolation=None, spectrum=None):
+    '''A Naive Fourier-Transform Pitch Detection Method for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    if spectrum is None:
+        spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
 
-    mags = np.abs(fft(signal, isCustomFFT))
+    plan = getDetectorPlan(spectrum.frames.shape[1], sampleRate, expectedMin, expectedMax, "naiveFT")
 
-    maxMag = 0
-    maxMagBin = 1
-    for i in range(max(1, minExpectedBin), min(len(mags), maxExpectedBin+1)):
-        if mags[i] > maxMag:
-            maxMag = mags[i]
-            maxMagBin = i
+    mags = spectrum.getMags()
+    maxMagBins = pickPeakBins(mags, plan.minBin, plan.maxBin)
+    if peakInterpolation is None:
+        return plan.freqVector[maxMagBins]
 
-    return freq_vector[maxMagBin]
+    return refinePeakBins(mags, maxMagBins, peakInterpolation, spectrum.getBins()) * plan.freqVector[1]
 
-def naiveFTWithPhase(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000):
+def naiveFTWithPhase(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, spectrum=None):
     '''Another Naive Fourier Transform approach where phase information is used to tweak the predition.
     Compute two overlapping fourier transforms and initially just choose the bin with the largest magnitude (in the second FT frame) - exactly the same as naiveFT.
     Then, use the phase information to tweak the prediction with an improved resolution. 
     This is the same method by which true-bin-frequenies are calculated in the phase vocoder implementation.'''
-    #First find the ideal FT window size (should be a power of 2), assuming a 75% overlap in the two windows.
-    windowLength = 2**(math.floor(math.log2(len(signal)*0.8)))
-    # print(windowLength)
-    freq_vector = np.fft.rfftfreq(windowLength, d=1/sampleRate)
-
-    expectedBins = np.where(freq_vector >= expectedMin)[0]
-    if len(expectedBins) == 0:
-        minExpectedBin = 1
-    else:
-        minExpectedBin = min(expectedBins)
+    return naiveFTWithPhaseBatch(np.asarray(signal)[np.newaxis], sampleRate, isCustomFFT, expectedMin, expectedMax, spectrum)[0]
 
-    expectedBins = np.where(freq_vector <= expectedMax)[0]
-    if len(expectedBins) == 0:
-        maxExpectedBin = len(freq_vector)
-    else:
-        maxExpectedBin = max(expectedBins)
+def naiveFTWithPhaseBatch(frames, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, spectrum=None):
+    '''naiveFTWithPhase for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    if spectrum is None:
+        spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
 
-    #Then get our two FT frames
-    bins1 = fft(signal[:windowLength], isCustomFFT)
-    bins2 = fft(signal[windowLength//4:windowLength+windowLength//4], isCustomFFT)
+    #The plan holds the ideal FT window size (the largest length the FFT handles efficiently, assuming a 75% overlap in the two windows) and the two windows themselves
+    plan = getDetectorPlan(spectrum.frames.shape[1], sampleRate, expectedMin, expectedMax, "naiveFTWithPhase")
+    window1, window2 = plan.windows
 
-    mags = np.abs(bins2)
+    #Then get our two FT frames and utilise the phase information
+    return getPhaseRefinedFreqs(spectrum.getMags(*window2), spectrum.getPhases(*window1), spectrum.getPhases(*window2), plan, (plan.windowLength//4)/sampleRate)
 
-    maxMag = 0
-    maxMagBin = 1
-    for i in range(max(1, minExpectedBin), min(len(mags), maxExpectedBin+1)):
-        if mags[i] > maxMag:
-            maxMag = mags[i]
-            maxMagBin = i
+def getPhaseRefinedFreqs(mags2, phases1, phases2, plan, deltaT_in):
+    '''Returns, for each row of the 2-D arrays of magnitudes and phases of pairs of FT frames (where the second frame of each pair starts *deltaT_in* seconds after the first),
+    the frequency of the largest peak (in the second frame) refined by the change in phase between the two frames.'''
+    maxMagBins = pickPeakBins(mags2, plan.minBin, plan.maxBin)
 
-    #Now to utilise the phase information
-    deltaT_in = (windowLength//4)/sampleRate
-    phaseDiff = cmath.phase(bins2[maxMagBin]) - cmath.phase(bins1[maxMagBin])
+    frameIndices = np.arange(len(mags2))
+    phaseDiff = phases2[frameIndices, maxMagBins] - phases1[frameIndices, maxMagBins]
 
-    numCyclesToTrueFreq = round(deltaT_in*freq_vector[maxMagBin] - phaseDiff/(2*math.pi))
+    numCyclesToTrueFreq = np.round(deltaT_in*plan.freqVector[maxMagBins] - phaseDiff/(2*math.pi))
     trueFreq = (phaseDiff + 2*math.pi*numCyclesToTrueFreq)/(2*math.pi*deltaT_in)
 
     return trueFreq
 
-def cepstrum(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000):
+def naiveFTWithPhaseTrack(signal, sampleRate, isCustomFFT, windowLength=2048, expectedMin=20, expectedMax=20000, windowFunction=None):
+    '''naiveFTWithPhase over a whole signal, giving a pitch track with one prediction every windowLength//4 samples.
+    Rather than two FTs per prediction, one STFT is taken with a hop of a quarter of a window, so that each FT frame is the second frame of one prediction and the first frame of
+    the next - roughly halving the number of FTs - and all of the frames are transformed together as one batch.
+    Prediction k uses the samples from k*hop to k*hop + windowLength + hop (where hop = windowLength//4). *windowFunction* (if given) is applied to each FT frame.'''
+    signal = np.asarray(signal, dtype=float)
+    hop = windowLength//4
+    if len(signal) < windowLength + hop:
+        return np.zeros(0)
+
+    #(a strided view of the signal, so the overlapping frames are not copied until they are windowed/transformed)
+    frames = np.lib.stride_tricks.sliding_window_view(signal, windowLength)[::hop]
+    if windowFunction is not None:
+        frames = frames * np.asarray(windowFunction)
+    spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
+
+    plan = getDetectorPlan(windowLength, sampleRate, expectedMin, expectedMax, "naiveFT")
+    mags, phases = spectrum.getMags(), spectrum.getPhases()
+
+    return getPhaseRefinedFreqs(mags[1:], phases[:-1], phases[1:], plan, hop/sampleRate)
+
+def cepstrum(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, peakInterpolation=None, isRealCepstrum=False, spectrum=None):
     '''Cepstrum Pitch Detection
     Predicts the frequency of a mono signal by finding the period which most strongly correlates to the distance between peaks in the Fourier-transform of the signal.
-    Assuming the peaks in the Fourier transform are located at harmonics of the signal, this period should represent the distance between the harmonics, i.e. the fundamental period.'''
-
-    freq_vector = np.fft.rfftfreq(len(signal), d=1/sampleRate)
-    mags = np.abs(fft(signal, isCustomFFT))
-    log_X = []
-
-    #to supress potential (very rare) numpy warnings that come with some particular signals (e.g. a 900Hz square wave w/ length 2048 and sample rate 44100Hz) -
-    #   not strictly necessary but leads to a better UX
-    zeroMagIndices = []
-    if 0 in mags: 
-        for i in range(len(mags)):
-            if mags[i] == 0:
-                log_X.append(float("inf"))
-                zeroMagIndices.append(i)
-            else:
-                log_X.append(np.log(mags[i]))
-        nonZeroMin = min(log_X)
-        for i in zeroMagIndices:
-            log_X[i] = nonZeroMin
+    Assuming the peaks in the Fourier transform are located at harmonics of the signal, this period should represent the distance between the harmonics, i.e. the fundamental period.
+    The peak may be refined to a quefrency between bins with *peakInterpolation* (see refinePeakBins).
+    By default the cepstrum is the magnitude of the Fourier transform of the (half) log-magnitude spectrum, but if *isRealCepstrum* is True the real cepstrum is used instead
+    (the inverse transform of the whole, even, log-magnitude spectrum), whose bins are lags in samples - see getRealCepstrum.'''
+    return cepstrumBatch(np.asarray(signal)[np.newaxis], sampleRate, isCustomFFT, expectedMin, expectedMax, peakInterpolation, isRealCepstrum, spectrum)[0]
+
+def cepstrumBatch(frames, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, peakInterpolation=None, isRealCepstrum=False, spectrum=None):
+    '''Cepstrum Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    if spectrum is None:
+        spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
+
+    plan = getDetectorPlan(spectrum.frames.shape[1], sampleRate, expectedMin, expectedMax, "cepstrum")
+
+    #to supress potential (very rare) numpy warnings that come with some particular signals (e.g. a 900Hz square wave w/ length 2048 and sample rate 44100Hz),
+    #   the log-magnitudes treat zero magnitudes as the smallest non-zero magnitude of their frame
+    log_X = spectrum.getLogMags()
+
+    if isRealCepstrum:
+        realCepstrum = getRealCepstrum(log_X, isCustomFFT)
+        maxLags = pickPeakBins(realCepstrum, plan.minCepstrumLag, plan.maxCepstrumLag, plan.minCepstrumLag)
+        return sampleRate/refinePeakBins(realCepstrum, maxLags, peakInterpolation)
+
+    complexCepstrumBins = fft(log_X, isCustomFFT)
+    cepstrumBins = np.abs(complexCepstrumBins)
+    cepstrumBins[~np.isfinite(cepstrumBins)] = 0
+
+    maxBins = pickPeakBins(cepstrumBins, plan.minQuefrencyBin, plan.maxQuefrencyBin, plan.minQuefrencyBin)
+    if peakInterpolation is None:
+        return 1/plan.quefrencies[maxBins]
+
+    return 1/(refinePeakBins(cepstrumBins, maxBins, peakInterpolation, complexCepstrumBins) * plan.quefrencies[1])
+
+def getRealCepstrum(log_X, isCustomFFT):
+    '''Returns the real cepstrum (for lags 0 to N/2) of each row of *log_X*, the log-magnitudes of the first N/2+1 bins of the spectrum of a real signal of even length N.
+    The whole log-magnitude spectrum is real and even, so its inverse transform is a DCT-I of the half spectrum - computed here as the real transform of the half spectrum's
+    even extension (N samples, so the real FFT only needs an N/2-point complex transform), rather than a full complex inverse transform.'''
+    evenExtension = np.concatenate((log_X, log_X[:, -2:0:-1]), axis=1)
+    return fft(evenExtension, isCustomFFT).real / evenExtension.shape[1]
+
+def HPS(signal, sampleRate, isCustomFFT, numDownsamples, expectedMin=20, expectedMax=20000, octaveTrick=True, peakInterpolation=None, spectrum=None):
+    '''Harmonic Product Spectrum Pitch Detection
+    Predicts the frequency of a mono signal by first computing (the magnitudes within) its Fourier-transform and then resampling (downsampling) this by factors of 1/2, 1/3, 1/4, etc. .
+    Then we may multiply these downsampled versions and can expect a peak correlating to the fundamental frequency of the original signal.
+    *numDownsamples* may also be given as a list, in which case a list of predictions (one per value) is returned.
+    The peak may be refined to a position between bins with *peakInterpolation* (see refinePeakBins - only "parabolic" applies to the product spectrum).'''
+    predictions = HPSBatch(np.asarray(signal)[np.newaxis], sampleRate, isCustomFFT, numDownsamples, expectedMin, expectedMax, octaveTrick, peakInterpolation, spectrum)
+    if np.ndim(numDownsamples) == 0:
+        return predictions[0]
+    return [prediction[0] for prediction in predictions]
+
+def HPSBatch(frames, sampleRate, isCustomFFT, numDownsamples, expectedMin=20, expectedMax=20000, octaveTrick=True, peakInterpolation=None, spectrum=None):
+    '''Harmonic Product Spectrum Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.
+    If *numDownsamples* is a list then a list of these arrays (one per value) is returned - the product of the downsampled spectra is built up
+    one factor at a time, so each value only costs the downsamples it adds to the previous (smaller) ones.'''
+    if spectrum is None:
+        spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
+
+    plan = getDetectorPlan(spectrum.frames.shape[1], sampleRate, expectedMin, expectedMax, "HPS")
+    mags = spectrum.getMags()
+
+    requestedNumDownsamples = [numDownsamples] if np.ndim(numDownsamples) == 0 else list(numDownsamples)
+    predictions = {}
+
+    #each downsampled spectrum (every ith bin) multiplies the bins it still covers
+    spectrumProduct = mags.copy()
+    if 0 in requestedNumDownsamples:
+        #(with no downsampling this is just the peak of the magnitude spectrum itself)
+        predictions[0] = pickHPSPeaks(spectrumProduct, plan, octaveTrick, peakInterpolation)
+    for i in range(1, max(requestedNumDownsamples)+1):
+        downsampledSpectrum = mags[:, plan.downsampleSlices[i-1]]
+        spectrumProduct[:, :downsampledSpectrum.shape[1]] *= downsampledSpectrum
+
+        if i in requestedNumDownsamples:
+            predictions[i] = pickHPSPeaks(spectrumProduct, plan, octaveTrick, peakInterpolation)
+
+    if np.ndim(numDownsamples) == 0:
+        return predictions[numDownsamples]
+    return [predictions[n] for n in requestedNumDownsamples]
+
+def pickHPSPeaks(spectrumProduct, plan, octaveTrick, peakInterpolation=None):
+    '''Returns the predicted frequency for each row of the 2-D array *spectrumProduct* (the harmonic product spectrum of each frame).'''
+    freq_vector = plan.freqVector
+
+    if not octaveTrick:
+        peakBins = pickPeakBins(spectrumProduct, plan.minBin, plan.maxBin)
     else:
-        #faster processing possible in this case and no need to worry about warnings
-        log_X = np.log(mags)
+        peakBins = pickOctaveCorrectedHPSBins(spectrumProduct, plan)
 
-    cepstrumBins = np.abs(fft(log_X, isCustomFFT))
-    quefrencies = np.fft.rfftfreq(len(log_X), d=freq_vector[1]-freq_vector[0])
+    if peakInterpolation is None:
+        return freq_vector[peakBins]
+    return refinePeakBins(spectrumProduct, peakBins, peakInterpolation) * freq_vector[1]
 
-    minExpectedBin = min(np.where(quefrencies >= 1/expectedMax)[0])
-    maxExpectedBin = max(np.where(quefrencies <= 1/expectedMin)[0])
-    
-    maxBin = max(5, minExpectedBin)
-    maxValue = 0
-    for i in range(max(5, minExpectedBin), min(len(cepstrumBins), maxExpectedBin+1)):
-        if cepstrumBins[i] > maxValue and cepstrumBins[i] < float("inf"):
-            maxValue = cepstrumBins[i]
-            maxBin = i
-    
-    return 1/quefrencies[maxBin]
+def pickOctaveCorrectedHPSBins(spectrumProduct, plan):
+    '''Returns the peak bin of each row of *spectrumProduct*, unless the second highest peak is (approximately) an octave below it, in which case that bin is given instead.'''
+    freq_vector = plan.freqVector
 
-def HPS(signal, sampleRate, isCustomFFT, numDownsamples, expectedMin=20, expectedMax=20000, octaveTrick=True):
-    '''Harmonic Product Spectrum Pitch Detection
-    Predicts the frequency of a mono signal by first computing (the magnitudes within) its Fourier-transform and then resampling (downsampling) this by factors of 1/2, 1/3, 1/4, etc. .
-    Then we may multiply these downsampled versions and can expect a peak correlating to the fundamental frequency of the original signal.'''
-    freq_vector = np.fft.rfftfreq(len(signal), d=1/sampleRate)
-    minExpectedBin = min(np.where(freq_vector >= expectedMin)[0])
-    maxExpectedBin = max(np.where(freq_vector <= expectedMax)[0])
-    mags = np.abs(fft(signal, isCustomFFT))
-
-    resampledSpectra = [resample(mags, sampleRate, sampleRate/i) for i in range(1 ,numDownsamples+1)]
-
-    for spectrum in resampledSpectra:
-        for i in range(len(mags)):
-            if i >= len(spectrum):
-                break
-            mags[i] *= spectrum[i]
-
-    maxMag = 0
-    maxMagBin = 1
-    for i in range(max(1, minExpectedBin), min(len(mags), maxExpectedBin+1)):
-        if mags[i] > maxMag:
-            maxMag = mags[i]
-            maxMagBin = i
+    maxMagBins, maxMag2Bins = pickTopTwoPeakBins(spectrumProduct, plan.minBin, plan.maxBin)
 
     #ocassionaly HPS predicts an octave too high, so if the second highest peak is at approximately half the frequency of the highest (that is, an octave below)
     #and the ratio of magnitudes between these two highest peaks is above 1/(2*numDownsamples), then predict the lower octave instead
     # This trick is far from 100% effective in reducing octave errors but does prove useful in some cases
-    if octaveTrick: 
-        maxMag2 = 0
-        maxMag2Bin = 1
-        for i in range(max(1, minExpectedBin), min(len(mags), maxExpectedBin+1)):
-            if mags[i] > maxMag2 and i != maxMagBin:
-                maxMag2 = mags[i]
-                maxMag2Bin = i
-
-        # print(maxMag / maxMag)
-
-        # allow for 50 cent leeway either side of the true octave below the highest peak
-        if abs(getMidiNoteWithCents(freq_vector[maxMagBin]) - getMidiNoteWithCents(2*freq_vector[maxMag2Bin])) <= 0.5 and maxMag2/maxMag >= 0.1:
-            return freq_vector[maxMag2Bin]
-
-    return freq_vector[maxMagBin]
-
+    frameIndices = np.arange(len(spectrumProduct))
+    maxMags = spectrumProduct[frameIndices, maxMagBins]
+    maxMags2 = np.where(maxMag2Bins == maxMagBins, 0, spectrumProduct[frameIndices, maxMag2Bins])
+
+    # allow for 50 cent leeway either side of the true octave below the highest peak
+    with np.errstate(divide="ignore", invalid="ignore"):
+        isOctaveError = (np.abs(12*np.log2(freq_vector[maxMagBins] / (2*freq_vector[maxMag2Bins]))) <= 0.5) & (maxMags2/maxMags >= 0.1)
+
+    return np.where(isOctaveError, maxMag2Bins, maxMagBins)
+
+
+def SHS(signal, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, numHarmonics=8, compression=0.84, centResolution=10, spectrum=None):
+    '''Subharmonic Summation Pitch Detection (Hermes, 1988)
+    Predicts the frequency of a mono signal by scoring candidate frequencies (spaced *centResolution* cents apart over the expected range) with the weighted sum of the spectrum's
+    magnitudes at their first *numHarmonics* harmonics, where the hth harmonic is weighted by *compression*^(h-1), and picking the highest scoring candidate.
+    Unlike HPS a single missing or weak harmonic only lowers a candidate's score rather than wiping it out. The peak is refined between candidates by parabolic interpolation.'''
+    return SHSBatch(np.asarray(signal)[np.newaxis], sampleRate, isCustomFFT, expectedMin, expectedMax, numHarmonics, compression, centResolution, spectrum)[0]
+
+def SHSBatch(frames, sampleRate, isCustomFFT, expectedMin=20, expectedMax=20000, numHarmonics=8, compression=0.84, centResolution=10, spectrum=None):
+    '''Subharmonic Summation Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    if spectrum is None:
+        spectrum = SpectrumContext(frames, sampleRate, isCustomFFT)
+
+    harmonicMatrix = getHarmonicMatrix(spectrum.frames.shape[1], sampleRate, getCentGrid(expectedMin, expectedMax, centResolution), numHarmonics, compression)
+    if len(harmonicMatrix.candidateFreqs) == 0:
+        return np.full(len(spectrum.frames), float(sampleRate))
+
+    scores = harmonicMatrix.score(spectrum.getMags())
+    refinedIndices = refinePeakBins(scores, np.argmax(scores, axis=1), "parabolic")
+
+    return harmonicMatrix.candidateFreqs[0] * 2**(refinedIndices*centResolution/1200)
+
+class HarmonicMatrix:
+    '''Sparse (candidates x bins) matrix whose rows give the weight of each bin of an N-sample frame's magnitude spectrum in the subharmonic summation score of one candidate frequency.
+    Each harmonic (below the Nyquist frequency) of a candidate is shared between the two bins either side of it by linear interpolation, so a row only has 2*numHarmonics non-zero elements.
+    The matrix is held as a scipy.sparse CSR matrix if scipy is installed, otherwise as the (bin, weight) pairs of each row which are summed with np.add.reduceat.
+    Use getHarmonicMatrix() rather than creating these directly so that matrices are shared between calls.'''
+    def __init__(self, N, sampleRate, candidateFreqs, numHarmonics, compression):
+        numBins = N//2 + 1
+
+        #only candidates whose fundamental lies below the final bin can be scored
+        candidateFreqs = np.array(candidateFreqs)
+        self.candidateFreqs = candidateFreqs[candidateFreqs*N/sampleRate < numBins - 1]
+        self.candidateFreqs.flags.writeable = False
+
+        harmonics = np.arange(1, numHarmonics+1)
+        harmonicBins = np.outer(self.candidateFreqs, harmonics)*N/sampleRate
+        harmonicWeights = np.broadcast_to(compression**(harmonics-1), harmonicBins.shape)
+        isBelowNyquist = harmonicBins < numBins - 1
+
+        lowerBins = np.floor(harmonicBins).astype(int)
+        fractions = harmonicBins - lowerBins
+        rows = np.broadcast_to(np.arange(len(self.candidateFreqs))[:, np.newaxis], harmonicBins.shape)
+
+        #(row-major order keeps each candidate's elements together, as reduceat needs)
+        rows = np.stack((rows, rows), axis=2)[isBelowNyquist]
+        bins = np.stack((lowerBins, lowerBins + 1), axis=2)[isBelowNyquist]
+        weights = np.stack((harmonicWeights*(1 - fractions), harmonicWeights*fractions), axis=2)[isBelowNyquist]
+
+        if csr_matrix is not None:
+            self.matrix = csr_matrix((weights.ravel(), (rows.ravel(), bins.ravel())), shape=(len(self.candidateFreqs), numBins))
+        else:
+            self.matrix = None
+            self.bins = bins.ravel()
+            self.weights = weights.ravel()
+            self.offsets = np.concatenate(([0], np.cumsum(np.bincount(rows.ravel(), minlength=len(self.candidateFreqs))[:-1])))
+
+    def score(self, mags):
+        '''Returns the (frames x candidates) scores of each candidate for each row of the 2-D array *mags* (frames x bins) in a single (sparse) matrix product.'''
+        if self.matrix is not None:
+            return np.asarray(self.matrix @ mags.T).T
+        return np.add.reduceat(mags[:, self.bins]*self.weights, self.offsets, axis=1)
+
+@lru_cache(maxsize=32)
+def getHarmonicMatrix(N, sampleRate, candidateFreqs, numHarmonics, compression):
+    '''Returns the (memoised) HarmonicMatrix for scoring the candidate frequencies (a tuple) with frames of N samples.'''
+    return HarmonicMatrix(N, sampleRate, candidateFreqs, numHarmonics, compression)
+
+def goertzel(signal, sampleRate, candidateFreqs):
+    '''Goertzel Filter Bank Pitch Detection
+    Predicts the frequency of a mono signal by picking whichever of the frequencies *candidateFreqs* (e.g. the notes of a scale) has the largest Fourier magnitude,
+    where (unlike naiveFT) only the candidates are evaluated rather than the whole spectrum - so it is only cheaper than an FFT for a handful of candidates.'''
+    return goertzelBatch(np.asarray(signal)[np.newaxis], sampleRate, candidateFreqs)[0]
+
+def goertzelBatch(frames, sampleRate, candidateFreqs):
+    '''Goertzel Filter Bank Pitch Detection for a 2-D array of frames (frames x samples), returning an array with one prediction per frame.'''
+    if candidateFreqs is None:
+        raise ValueError("goertzel needs candidate frequencies - for a search over the whole expected range use naiveFT (with peakInterpolation) or SHS instead")
+    frames = np.asarray(frames, dtype=float)
+    candidateFreqs, bank = getGoertzelBank(frames.shape[1], sampleRate, tuple(float(freq) for freq in candidateFreqs))
+    if len(candidateFreqs) == 0:
+        return np.full(len(frames), float(sampleRate))
+
+    #the bank holds the cosine and sine terms of every candidate side by side, so one matrix product gives the real and imaginary parts of all of their (unnormalised) DFT values
+    terms = frames @ bank
+    mags = np.hypot(terms[:, :len(candidateFreqs)], terms[:, len(candidateFreqs):])
+    return candidateFreqs[np.argmax(mags, axis=1)]
+
+@lru_cache(maxsize=32)
+def getCentGrid(expectedMin, expectedMax, centResolution):
+    '''Returns the (memoised) tuple of frequencies from *expectedMin* up to *expectedMax* spaced *centResolution* cents apart (the candidates scored by SHS).'''
+    numSteps = math.floor(1200*math.log2(expectedMax/expectedMin)/centResolution)
+    return tuple(expectedMin * 2**(np.arange(numSteps+1)*centResolution/1200))
+
+@lru_cache(maxsize=8)
+def getGoertzelBank(N, sampleRate, candidateFreqs):
+    '''Returns the (memoised, read-only) candidate frequencies below the Nyquist frequency along with an N x 2*(number of candidates) matrix of their cosine and sine terms,
+    i.e. what a Goertzel filter tuned to each candidate accumulates over N samples - the whole bank can then be run on many frames with a single matrix product.'''
+    candidateFreqs = np.array([freq for freq in candidateFreqs if 0 < freq < sampleRate/2])
+    phases = 2*np.pi*np.outer(np.arange(N), candidateFreqs)/sampleRate
+    bank = np.concatenate((np.cos(phases), -np.sin(phases)), axis=1)
+
+    candidateFreqs.flags.writeable = False
+    bank.flags.writeable = False
+    return candidateFreqs, bank
 
 #### Functions utilising all pitch detection algorithms
 
 ## Function to return a dictionary of predictions from all algorithms
+#  (the frequency-domain algorithms share a single SpectrumContext so that the signal's Fourier transform is only computed once)
 def getAllPredictions(signal, sampleRate, b, isCustomFFT, numDownsamples):
+    spectrum = SpectrumContext(signal, sampleRate, isCustomFFT)
     predictions = {"zerocross" : zerocross(signal, sampleRate), 
                    "autocorrelation" : autocorrelation(signal, sampleRate), 
                    "AMDF" : AMDF(signal, sampleRate, b), 
-                   "naiveFT" : naiveFT(signal, sampleRate, isCustomFFT),
-                   "naiveFTWithPhase" : naiveFTWithPhase(signal, sampleRate, isCustomFFT),
-                   "cepstrum" : cepstrum(signal, sampleRate, isCustomFFT), 
-                   "HPS" : HPS(signal, sampleRate, isCustomFFT, numDownsamples)}
+                   "naiveFT" : naiveFT(signal, sampleRate, isCustomFFT, spectrum=spectrum),
+                   "naiveFTWithPhase" : naiveFTWithPhase(signal, sampleRate, isCustomFFT, spectrum=spectrum),
+                   "cepstrum" : cepstrum(signal, sampleRate, isCustomFFT, spectrum=spectrum), 
+                   "HPS" : HPS(signal, sampleRate, isCustomFFT, numDownsamples, spectrum=spectrum)}
     
     return predictions
 
 def getTrimmedMeanPrediction(signal, sampleRate, b, isCustomFFT, numDownsamples, trimSize):
+    spectrum = SpectrumContext(signal, sampleRate, isCustomFFT)
     predictions = [zerocross(signal, sampleRate), autocorrelation(signal, sampleRate), AMDF(signal, sampleRate, b),
-        naiveFT(signal, sampleRate, isCustomFFT), naiveFTWithPhase(signal, sampleRate, isCustomFFT), 
-        cepstrum(signal, sampleRate, isCustomFFT), HPS(signal, sampleRate, isCustomFFT, numDownsamples)]
+        naiveFT(signal, sampleRate, isCustomFFT, spectrum=spectrum), naiveFTWithPhase(signal, sampleRate, isCustomFFT, spectrum=spectrum), 
+        cepstrum(signal, sampleRate, isCustomFFT, spectrum=spectrum), HPS(signal, sampleRate, isCustomFFT, numDownsamples, spectrum=spectrum)]
     return getTrimmedMean(predictions, trimSize)
@@ -3,6 +3,7 @@ from helpers import *
 from PitchProfile import PitchProfile
 from timeit import default_timer as timer
 import soundfile as sf
+import numpy as np
 from copy import deepcopy
 
 def dictionaryToCSVLine(dictionary, algorithm, b, isCustomFFT, numDownsamples, octaveTrick, predFreq, time):
@@ -69,16 +70,16 @@ def testToCSV(signal, testInfo, csvFilePath):
 
         f.write(dictionaryToCSVLine(testInfo,"autocorrelation","n/a","n/a","n/a","n/a", pred, end-start))
 
-        #AMDF
-        for b in testInfo["b"]:
-            start = timer()
-            pred = predict.AMDF(signal, sampleRate, b, expectedMin, expectedMax)
-            end = timer()
+        #AMDF - all values of b are evaluated in one call (sharing the absolute differences), so the execution time is split evenly between them
+        start = timer()
+        AMDFPredictions = predict.AMDF(signal, sampleRate, testInfo["b"], expectedMin, expectedMax)
+        end = timer()
 
+        for b, pred in zip(testInfo["b"], AMDFPredictions):
             predictions[2].append(pred)
-            executionTimes[2].append(end-start)
+            executionTimes[2].append((end-start)/len(testInfo["b"]))
 
-            f.write(dictionaryToCSVLine(testInfo,"AMDF",b,"n/a","n/a","n/a", pred, end-start))
+            f.write(dictionaryToCSVLine(testInfo,"AMDF",b,"n/a","n/a","n/a", pred, (end-start)/len(testInfo["b"])))
 
         for isCustomFFT in testInfo["isCustomFFT"]:
             #naiveFT
@@ -114,17 +115,25 @@ def testToCSV(signal, testInfo, csvFilePath):
 
             f.write(dictionaryToCSVLine(testInfo,"cepstrum","n/a",isCustomFFT,"n/a","n/a", pred, end-start))
 
+            #HPS - all values of numDownsamples are evaluated in one call per octaveTrick value (sharing the running product of the downsampled spectra),
+            #   so the execution time is split evenly between them
+            HPSResults = {}
+            for octaveTrick in testInfo["octaveTrick"]:
+                start = timer()
+                HPSPredictions = predict.HPS(signal, sampleRate, isCustomFFT, testInfo["numDownsamples"], expectedMin, expectedMax, octaveTrick)
+                end = timer()
+
+                for numDownsamples, pred in zip(testInfo["numDownsamples"], HPSPredictions):
+                    HPSResults[(numDownsamples, octaveTrick)] = (pred, (end-start)/len(testInfo["numDownsamples"]))
+
             for numDownsamples in testInfo["numDownsamples"]:
                 for octaveTrick in testInfo["octaveTrick"]:
-                    #HPS
-                    start = timer()
-                    pred = predict.HPS(signal, sampleRate, isCustomFFT, numDownsamples, expectedMin, expectedMax, octaveTrick)
-                    end = timer()
+                    pred, time = HPSResults[(numDownsamples, octaveTrick)]
 
                     predictions[6] = pred
-                    executionTimes[0] = end-start
+                    executionTimes[6] = time
 
-                    f.write(dictionaryToCSVLine(testInfo,"HPS","n/a",isCustomFFT,numDownsamples,octaveTrick, pred, end-start))
+                    f.write(dictionaryToCSVLine(testInfo,"HPS","n/a",isCustomFFT,numDownsamples,octaveTrick, pred, time))
 
                     for bIndex in range(len(testInfo["b"])):
                         #trimmedMean - excluding smallest two and largest two predictions and max
@@ -144,15 +153,11 @@ def getPitchDataMeanErrors(expectedPitchData, actualPitchData):
         [meanPercentError, meanAbsoluteMidiError, meanCorrectNote, meanCorrectNoteWithOctaveError]
     with each of those values defined as in helpers.py and analyse.py.'''
     numDataPoints = min(len(expectedPitchData), len(actualPitchData))
-    meanErrors = [0,0,0,0]
-
-    for i in range(numDataPoints):
-        meanErrors[0] += getPercentageError(expectedPitchData[i], actualPitchData[i])
-        meanErrors[1] += getAbsoluteMIDIError(expectedPitchData[i], actualPitchData[i])
-        meanErrors[2] += isWithin100Cents(expectedPitchData[i], actualPitchData[i])
-        meanErrors[3] += isWithin100CentsWithOctaveError(expectedPitchData[i], actualPitchData[i])
+    expectedPitchData = np.array(expectedPitchData[:numDataPoints], dtype=float)
+    actualPitchData = np.array(actualPitchData[:numDataPoints], dtype=float)
 
-    return [x/numDataPoints for x in meanErrors]
+    errorFunctions = [getPercentageError, getAbsoluteMIDIError, isWithin100Cents, isWithin100CentsWithOctaveError]
+    return [float(np.mean(errorFunction(expectedPitchData, actualPitchData))) for errorFunction in errorFunctions]
 
 def ratioTestToCSV(originalPitchProfile, scalingFactor, csvFilePath, verbose=False, saveFile=None):
     '''This function assumes that the csv file already contains headers: 